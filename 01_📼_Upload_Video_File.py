@@ -1,20 +1,18 @@
+import functools
 import os
 import tempfile
-import time
 
-import cv2
-import moviepy.editor as mp
-import numpy as np
 import streamlit as st
 
-from tqdm import tqdm
+from jobs import JOB_WORKERS
+from utils import display_video_job, get_model, poll_job, setup_columns, set_page_config, start_job
+from video import REUSE_MODES, colorize_video_job
 
-from utils import format_time, colorize_frame, change_model, load_model, setup_columns, set_page_config
+# Key of the background job of the session in st.session_state
+JOB_KEY = "upload_video_job"
 
 set_page_config()
-loaded_model = load_model()
 col2 = setup_columns()
-current_model = None
 
 with col2:
     st.write(
@@ -37,105 +35,58 @@ def main():
         index=0,
     )
 
-    loaded_model = change_model(current_model, model)
     st.write(f"Model is now {model}")
 
+    workers = st.number_input(
+        "Worker processes (more than one colorizes chunks of the video in parallel)",
+        min_value=1,
+        # the CPUs are shared by the jobs running at the same time
+        max_value=max((os.cpu_count() or 1) // JOB_WORKERS, 1),
+        value=1,
+    )
+    reuse_mode = st.selectbox(
+        "Frame reuse (faster on footage with static shots or slow motion, at some cost in color accuracy)",
+        list(REUSE_MODES),
+        index=0,
+    )
+    resumable = st.checkbox(
+        "Save progress every few seconds of video, so that colorizing the same video with the same settings again "
+        "resumes an interrupted run (in a single process)"
+    )
+
     uploaded_file = st.file_uploader("Upload your video here...", type=["mp4", "mov", "avi", "mkv"])
 
     if st.button("Colorize"):
+        # Models are loaded on first use and shared between pages and sessions
+        loaded_model = get_model(model)
         if uploaded_file is not None:
             file_extension = os.path.splitext(uploaded_file.name)[1].lower()
             if file_extension in [".mp4", ".avi", ".mov", ".mkv"]:
-                # Save the video file to a temporary location
-                temp_file = tempfile.NamedTemporaryFile(delete=False)
-                temp_file.write(uploaded_file.read())
-
-                audio = mp.AudioFileClip(temp_file.name)
-
-                # Open the video using cv2.VideoCapture
-                video = cv2.VideoCapture(temp_file.name)
-
-                # Get video information
-                fps = video.get(cv2.CAP_PROP_FPS)
-
-                col1, col2 = st.columns([0.5, 0.5])
-                with col1:
-                    st.markdown('<p style="text-align: center;">Before</p>', unsafe_allow_html=True)
-                    st.video(temp_file.name)
-
-                with col2:
-                    st.markdown('<p style="text-align: center;">After</p>', unsafe_allow_html=True)
-
-                    with st.spinner("Colorizing frames..."):
-                        # Colorize video frames and store in a list
-                        output_frames = []
-                        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-                        progress_bar = st.progress(0)  # Create a progress bar
-
-                        start_time = time.time()
-                        time_text = st.text("Time Remaining: ")  # Initialize text value
-
-                        for _ in tqdm(range(total_frames), unit="frame", desc="Progress"):
-                            ret, frame = video.read()
-                            if not ret:
-                                break
-
-                            colorized_frame = colorize_frame(frame, loaded_model)
-                            output_frames.append((colorized_frame * 255).astype(np.uint8))
-
-                            elapsed_time = time.time() - start_time
-                            frames_completed = len(output_frames)
-                            frames_remaining = total_frames - frames_completed
-                            time_remaining = (frames_remaining / frames_completed) * elapsed_time
-
-                            progress_bar.progress(frames_completed / total_frames)  # Update progress bar
-
-                            if frames_completed < total_frames:
-                                time_text.text(f"Time Remaining: {format_time(time_remaining)}")  # Update text value
-                            else:
-                                time_text.empty()  # Remove text value
-                                progress_bar.empty()
-
-                    with st.spinner("Merging frames to video..."):
-                        frame_size = output_frames[0].shape[:2]
-                        output_filename = "output.mp4"
-                        fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # Codec for MP4 video
-                        out = cv2.VideoWriter(output_filename, fourcc, fps, (frame_size[1], frame_size[0]))
-
-                        # Display the colorized video using st.video
-                        for frame in output_frames:
-                            frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-
-                            out.write(frame_bgr)
-
-                        out.release()
-
-                        # Convert the output video to a format compatible with Streamlit
-                        converted_filename = "converted_output.mp4"
-                        clip = mp.VideoFileClip(output_filename)
-                        clip = clip.set_audio(audio)
-
-                        clip.write_videofile(converted_filename, codec="libx264")
-
-                        # Display the converted video using st.video()
-                        st.video(converted_filename)
-                        st.balloons()
-
-                        # Add a download button for the colorized video
-                        st.download_button(
-                            label="Download Colorized Video",
-                            data=open(converted_filename, "rb").read(),
-                            file_name="colorized_video.mp4",
-                        )
-
-                        # Close and delete the temporary file after processing
-                        video.release()
-                        temp_file.close()
+                # Save the video file to a temporary location, deleted with the job
+                with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
+                    temp_file.write(uploaded_file.read())
+
+                # Colorize video frames in the background and encode them to H.264 as they are ready, with the
+                # original audio. The job survives reruns of the page, which polls it until it is done.
+                work = functools.partial(
+                    colorize_video_job,
+                    source=temp_file.name,
+                    model=model,
+                    colorizer=loaded_model,
+                    workers=workers,
+                    reuse=REUSE_MODES[reuse_mode],
+                    resumable=resumable,
+                )
+                start_job(JOB_KEY, work, temp_file.name, files=[temp_file.name])
+
+    return display_video_job(JOB_KEY)
 
 
 if __name__ == "__main__":
-    main()
+    pending = main()
     st.markdown(
         "###### Made with :heart: by [Clément Delteil](https://www.linkedin.com/in/clementdelteil/) [![this is an "
         "image link](https://i.imgur.com/thJhzOO.png)](https://www.buymeacoffee.com/clementdelteil)"
     )
+    if pending:
+        poll_job()
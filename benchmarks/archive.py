@@ -0,0 +1,130 @@
+"""
+Compares the way the image page used to build its zip (JPEGs saved to the working directory, zipped to disk, read
+back for the download) with ImageArchive, which encodes them straight into a zip spooled to an anonymous temporary
+file, read for the download through ImageArchive.file() or ImageArchive.getvalue(). Reports wall-clock time and how
+much the peak RSS grew while building and reading the archive for a batch of colorized images. Every run happens in a
+fresh process so that its peak RSS is its own, and the RSS includes the memory of PIL's encoders. "not read" only
+builds the archive: what it uses is bounded by ImageArchive's spool size, whereas reading the data for
+st.download_button, which serves downloads from memory, costs the size of the archive whatever the way.
+
+    python -m benchmarks.archive --images 500 --size 1920 1080
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+from utils import ImageArchive
+
+
+def synthetic_image(width: int, height: int) -> np.ndarray:
+    """
+    Smooth colored gradient with some noise, values in [0, 1], compressing about like a photograph
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([x / width, y / height, (x + y) / (width + height)], axis=2)
+    image += np.random.default_rng(0).normal(0, 0.02, image.shape).astype(np.float32)
+    return image.clip(0, 1)
+
+
+def on_disk(images, workdir: str) -> bytes:
+    """
+    Previous behaviour of the image page: IMG_<i>.jpg files, a zip on disk, then its bytes
+    """
+    names = []
+    for i, image in enumerate(images):
+        names.append(os.path.join(workdir, "IMG_" + str(i + 1) + ".jpg"))
+        Image.fromarray((image * 255).astype(np.uint8)).save(names[-1])
+    zip_filename = os.path.join(workdir, "colorized_images.zip")
+    with zipfile.ZipFile(zip_filename, "w") as zip_file:
+        for name in names:
+            zip_file.write(name, os.path.basename(name))
+    with open(zip_filename, "rb") as file:
+        return file.read()
+
+
+def archive(images, read) -> bytes:
+    """
+    ImageArchive, read with read(archive) the way st.download_button reads the data it is given
+    """
+    with ImageArchive() as zip_archive:
+        for i, image in enumerate(images):
+            zip_archive.add("IMG_" + str(i + 1) + ".jpg", image)
+        return read(zip_archive)
+
+
+def built(images, workdir: str) -> bytes:
+    """
+    ImageArchive built but not read, the memory it needs before the download makes its copy
+    """
+    archive(images, ImageArchive.file)
+    return b""
+
+
+MODES = {
+    "on disk": on_disk,
+    "file()": lambda images, workdir: archive(images, lambda zip_archive: zip_archive.file().read()),
+    "getvalue()": lambda images, workdir: archive(images, lambda zip_archive: zip_archive.getvalue()),
+    "not read": built,
+}
+
+
+def peak_rss_mib() -> float:
+    """
+    Peak RSS of this process so far, ru_maxrss is in KiB on Linux
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(mode: str, count: int, size: tuple):
+    """
+    Builds and reads one archive in this process, prints seconds, growth of the peak RSS in MiB and zip MiB
+    """
+    image = synthetic_image(*size)
+    # the same colorized image over and over, as colorize_images would hand them out one at a time
+    images = (image for _ in range(count))
+    baseline = peak_rss_mib()
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        data = MODES[mode](images, workdir)
+        elapsed = time.perf_counter() - start
+    print(elapsed, peak_rss_mib() - baseline, len(data) / 2**20)
+
+
+def main():
+    """
+    Print time, growth of the peak RSS and archive size of every way of building the zip
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 720), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--run", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.images, args.size)
+        return
+
+    print(f"{args.images} images of {args.size[0]}x{args.size[1]}")
+    print(f"{'archive':<12}{'seconds':>10}{'peak RSS +MiB':>15}{'zip MiB':>10}")
+    for mode in MODES:
+        command = [sys.executable, "-m", "benchmarks.archive", "--run", mode, "--images", str(args.images)]
+        command += ["--size"] + [str(side) for side in args.size]
+        result = subprocess.run(command, capture_output=True, text=True, check=False)
+        if result.returncode != 0:
+            print(f"{mode:<12}{'failed (exit ' + str(result.returncode) + ')':>35}")
+            continue
+        elapsed, peak, zip_size = map(float, result.stdout.split()[-3:])
+        print(f"{mode:<12}{elapsed:>10.2f}{peak:>15.1f}{zip_size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
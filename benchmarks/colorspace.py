@@ -0,0 +1,64 @@
+"""
+Benchmarks the float32 colour conversions of the colorizers against skimage.color, which they replace.
+
+    python -m benchmarks.colorspace --repeat 5
+"""
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+from skimage import color
+
+from models.deep_colorization.colorizers import colorspace
+
+RESOLUTIONS = {"480p": (480, 854), "720p": (720, 1280), "1080p": (1080, 1920)}
+
+
+def best_time(fn, arg, repeat: int) -> float:
+    """
+    Returns the best wall-clock time of fn(arg) over repeat runs, in milliseconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    """
+    Print timings and maximum absolute differences for every resolution
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'conversion':<18}{'size':<8}{'skimage ms':>12}{'float32 ms':>12}{'speed-up':>10}{'max diff':>12}")
+    for name, (height, width) in RESOLUTIONS.items():
+        rgb = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        lab = color.rgb2lab(rgb)
+
+        with warnings.catch_warnings():
+            # skimage warns about negative Z values when ab are out of gamut
+            warnings.simplefilter("ignore")
+            cases = (
+                ("rgb2lab", color.rgb2lab, colorspace.rgb2lab, rgb, lab),
+                ("rgb2lab (L only)", lambda img: color.rgb2lab(img)[..., 0], colorspace.rgb2l, rgb, lab[..., 0]),
+                ("lab2rgb", color.lab2rgb, colorspace.lab2rgb, lab, color.lab2rgb(lab)),
+            )
+            for conversion, reference, candidate, arg, expected in cases:
+                reference_ms = best_time(reference, arg, args.repeat)
+                candidate_ms = best_time(candidate, arg, args.repeat)
+                diff = np.abs(candidate(arg) - expected).max()
+                print(
+                    f"{conversion:<18}{name:<8}{reference_ms:>12.1f}{candidate_ms:>12.1f}"
+                    f"{reference_ms / candidate_ms:>9.1f}x{diff:>12.2e}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares the time spent writing a colorized video the old way (OpenCV's mp4v writer, then a second encode to H.264
+with the audio, as moviepy did) with FFmpegWriter's single H.264 encode muxing the audio as it is.
+
+    python -m benchmarks.encode --frames 600 --size 1280 720
+
+The old second pass is timed as a plain ffmpeg re-encode, moviepy also decoded and re-piped every frame through
+Python, so the real saving was larger.
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import cv2
+import imageio_ffmpeg
+import numpy as np
+
+from video import FFmpegWriter
+
+
+def synthetic_frames(count: int, width: int, height: int):
+    """
+    Yields count BGR frames of a moving colored gradient
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    for i in range(count):
+        frame = np.stack([(x + 4 * i) % 256, (y + 2 * i) % 256, (x + y) % 256], axis=2)
+        yield frame.astype(np.uint8)
+
+
+def make_audio(path: str, seconds: float):
+    """
+    Writes a sine tone of the given length as AAC to path
+    """
+    subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=duration={seconds}"]
+        + ["-c:a", "aac", path],
+        check=True,
+    )
+
+
+def two_pass(frames, fps: float, size: tuple, audio: str, workdir: str) -> float:
+    """
+    mp4v with OpenCV, then H.264 with the audio, returns the seconds spent
+    """
+    start = time.perf_counter()
+    output_filename = os.path.join(workdir, "output.mp4")
+    out = cv2.VideoWriter(output_filename, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", "-i", output_filename, "-i", audio]
+        + ["-map", "0:v", "-map", "1:a", "-c:v", "libx264", "-c:a", "aac", os.path.join(workdir, "converted.mp4")],
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def single_pass(frames, fps: float, size: tuple, audio: str, workdir: str) -> float:
+    """
+    FFmpegWriter, returns the seconds spent
+    """
+    start = time.perf_counter()
+    with FFmpegWriter(os.path.join(workdir, "colorized.mp4"), fps, size, audio_source=audio) as out:
+        for frame in frames:
+            out.write(frame)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Print the time each way of writing the video takes
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", type=int, nargs=2, default=(640, 360), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--fps", type=float, default=25.0)
+    args = parser.parse_args()
+
+    # frames are generated up front so that only writing is timed
+    frames = list(synthetic_frames(args.frames, *args.size))
+    print(f"{args.frames} frames of {args.size[0]}x{args.size[1]}")
+    with tempfile.TemporaryDirectory() as workdir:
+        audio = os.path.join(workdir, "audio.m4a")
+        make_audio(audio, args.frames / args.fps)
+        baseline = two_pass(frames, args.fps, tuple(args.size), audio, workdir)
+        elapsed = single_pass(frames, args.fps, tuple(args.size), audio, workdir)
+    print(f"{'mp4v + re-encode':<20}{baseline:>8.2f} s")
+    print(f"{'single encode':<20}{elapsed:>8.2f} s{baseline / elapsed:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
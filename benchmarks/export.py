@@ -0,0 +1,58 @@
+"""
+Compares startup time and per-frame latency of the eager models with their TorchScript export, cold (traced and
+written to the cache) and warm (loaded from the cache).
+
+    python -m benchmarks.export --pretrained --batch-size 8
+"""
+
+import argparse
+import tempfile
+import time
+
+import torch
+
+from benchmarks.precision import latency
+from models.deep_colorization import MODELS, InferenceSession
+from models.deep_colorization.colorizers import load_compiled
+
+
+def timed(fn):
+    """
+    Returns the result of fn() and its wall-clock time in milliseconds
+    """
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    """
+    Print startup and per-frame latency of eager, cold compiled and warm compiled models
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--pretrained", action="store_true", help="use the released weights instead of random ones")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tens_l_rs = torch.rand(args.batch_size, 1, 256, 256) * 100
+    print(f"{'model':<12}{'mode':<18}{'startup ms':>12}{'ms/frame':>10}{'speed-up':>10}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, factory in MODELS.items():
+            generator, eager_startup = timed(lambda factory=factory: factory(pretrained=args.pretrained))
+            modes = [("eager", generator, eager_startup)]
+            for mode in ("compiled (cold)", "compiled (warm)"):
+                compiled, startup = timed(
+                    lambda: load_compiled(name, lambda: generator, batch_size=args.batch_size, cache_dir=cache_dir)
+                )
+                modes.append((mode, compiled, startup))
+
+            reference = None
+            for mode, model, startup in modes:
+                elapsed = latency(InferenceSession(model), tens_l_rs, args.repeat) / args.batch_size
+                reference = reference or elapsed
+                print(f"{name:<12}{mode:<18}{startup:>12.0f}{elapsed:>10.1f}{reference / elapsed:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
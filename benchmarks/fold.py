@@ -0,0 +1,62 @@
+"""
+Compares the generators with their batch-norm folded copies: folded layers, weight bytes, per-frame latency and the
+largest difference of their ab outputs. Random weights get random batch-norm statistics so that folding is not a
+no-op.
+
+    python -m benchmarks.fold --pretrained --batch-size 8
+"""
+
+import argparse
+
+import torch
+from torch import nn
+
+from benchmarks.precision import latency
+from models.deep_colorization import MODELS, InferenceSession, fold_batchnorm
+from models.deep_colorization.colorizers import model_bytes
+
+
+def randomize_batchnorms(model):
+    """
+    Gives every batch-norm of model random running statistics and positive random scales
+    """
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            module.running_mean.uniform_(-1, 1)
+            module.running_var.uniform_(0.5, 2)
+            if module.affine:
+                module.weight.data.uniform_(0.5, 1.5)
+                module.bias.data.uniform_(-0.5, 0.5)
+
+
+def main():
+    """
+    Print folded layers, size, latency and output difference of each generator and its folded copy
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--pretrained", action="store_true", help="use the released weights instead of random ones")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tens_l_rs = torch.rand(args.batch_size, 1, 256, 256) * 100
+    print(f"{'model':<12}{'mode':<10}{'folded':>8}{'MB':>8}{'ms/frame':>10}{'speed-up':>10}{'max |ab diff|':>15}")
+    for name, factory in MODELS.items():
+        generator = factory(pretrained=args.pretrained).eval()
+        if not args.pretrained:
+            randomize_batchnorms(generator)
+        folded, count = fold_batchnorm(generator)
+
+        reference, session = InferenceSession(generator), InferenceSession(folded)
+        diff = (reference(tens_l_rs) - session(tens_l_rs)).abs().max().item()
+        baseline = latency(reference, tens_l_rs, args.repeat) / args.batch_size
+        elapsed = latency(session, tens_l_rs, args.repeat) / args.batch_size
+        print(f"{name:<12}{'original':<10}{0:>8}{model_bytes(generator) / 2**20:>8.2f}{baseline:>10.1f}{1:>9.2f}x")
+        print(
+            f"{name:<12}{'folded':<10}{count:>8}{model_bytes(folded) / 2**20:>8.2f}"
+            f"{elapsed:>10.1f}{baseline / elapsed:>9.2f}x{diff:>15.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Reports the activation memory the InferenceSession saves per frame compared with calling the model with autograd on.
+
+    python -m benchmarks.inference_memory --batch-size 8
+"""
+
+import argparse
+
+from models.deep_colorization import autograd_bytes_per_frame
+from models.deep_colorization.colorizers import ECCVGenerator, SIGGRAPHGenerator
+
+
+def main():
+    """
+    Print the memory saved per frame for both generators
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, generator in (("ECCV16", ECCVGenerator), ("SIGGRAPH17", SIGGRAPHGenerator)):
+        saved = autograd_bytes_per_frame(generator(), batch_size=args.batch_size)
+        print(f"{name}: {saved / 2**20:.1f} MiB of activations saved per frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Reports the throughput of keyframe-only colorization (video.KeyframePropagator) against its color error,
+compared with colorizing every frame.
+
+    python -m benchmarks.keyframes --video clip.mp4 --pretrained --intervals 2 5 10
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from models.deep_colorization import MODELS, InferenceSession
+from utils import colorize_frames, read_frames
+from video import KeyframePropagator
+
+
+def synthetic_frames(count: int, size=(360, 640)):
+    """
+    Yields frames of a textured pattern panning across the screen
+    """
+    rng = np.random.default_rng(0)
+    low = rng.integers(0, 256, (size[0] // 32, size[1] // 16), dtype=np.uint8)
+    texture = cv2.resize(low, (size[1] * 2, size[0]), interpolation=cv2.INTER_CUBIC)
+    for i in range(count):
+        gray = texture[:, 2 * i : 2 * i + size[1]]
+        yield np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def colorize_all(frames, colorizer, reuse):
+    """
+    Returns the colorized frames as uint8 and the frames per second
+    """
+    start = time.perf_counter()
+    colorized = [(frame * 255).astype(np.uint8) for frame in colorize_frames(frames, colorizer, reuse=reuse)]
+    return colorized, len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    """
+    Print frames per second and mean color error for every keyframe interval
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="video file, a synthetic panning pattern is used otherwise")
+    parser.add_argument("--frames", type=int, default=60, help="number of frames to colorize")
+    parser.add_argument("--model", choices=list(MODELS), default="ECCV16")
+    parser.add_argument("--pretrained", action="store_true", help="use the released weights instead of random ones")
+    parser.add_argument("--intervals", type=int, nargs="+", default=[2, 5, 10])
+    args = parser.parse_args()
+
+    if args.video:
+        video = cv2.VideoCapture(args.video)
+        frames = [frame for _, frame in zip(range(args.frames), read_frames(video))]
+        video.release()
+    else:
+        frames = list(synthetic_frames(args.frames))
+
+    torch.manual_seed(0)
+    colorizer = InferenceSession(MODELS[args.model](pretrained=args.pretrained))
+    reference, reference_fps = colorize_all(frames, colorizer, None)
+    print(f"{'interval':>8}{'keyframes':>11}{'fps':>8}{'speed-up':>10}{'mean error':>12}{'max error':>11}")
+    print(f"{1:>8}{len(frames):>11}{reference_fps:>8.2f}{1:>9.1f}x{0:>12.2f}{0:>11}")
+    for interval in args.intervals:
+        propagator = KeyframePropagator(interval=interval)
+        colorized, fps = colorize_all(frames, colorizer, propagator)
+        error = np.abs(np.stack(colorized).astype(np.int16) - np.stack(reference))
+        print(
+            f"{interval:>8}{propagator.misses:>11}{fps:>8.2f}{fps / reference_fps:>9.1f}x"
+            f"{error.mean():>12.2f}{error.max():>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Reports per-frame latency and color error of the bf16 and int8 precision modes against fp32.
+
+    python -m benchmarks.precision --pretrained --images path/to/images
+
+The images are split in two disjoint sets: the first --calibration-fraction of them calibrate the int8 models and the
+others measure the color error, which would otherwise be optimistic for int8. Without --images, the colour
+photographs of scikit-image are used.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from benchmarks.preprocess_quality import sample_images
+from models.deep_colorization import MODELS, PRECISIONS, load_img, postprocess_tens, prepare_model, preprocess_img
+
+
+def latency(colorizer, tens_l_rs, repeat: int) -> float:
+    """
+    Returns the best time of a forward pass over repeat runs, in milliseconds
+    """
+    colorizer(tens_l_rs)  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        colorizer(tens_l_rs)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    """
+    Print latency and color error of every precision for both models
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="directory of images split between calibration and evaluation")
+    parser.add_argument(
+        "--calibration-fraction", type=float, default=0.5, help="share of the images used for int8 calibration only"
+    )
+    parser.add_argument("--pretrained", action="store_true", help="use the released weights instead of random ones")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.images:
+        images = [load_img(path)[:, :, :3] for path in sorted(Path(args.images).iterdir()) if path.is_file()]
+    else:
+        images = list(sample_images().values())
+    if len(images) < 2:
+        parser.error("at least two images are needed, one to calibrate and one to evaluate")
+    inputs = [preprocess_img(img, HW=(256, 256)) for img in images]
+    split = min(max(round(len(inputs) * args.calibration_fraction), 1), len(inputs) - 1)
+    calibration = [torch.cat([tens_l_rs for _, tens_l_rs in inputs[:split]])]
+    inputs = inputs[split:]
+    print(f"{split} calibration image(s), {len(inputs)} evaluation image(s)")
+
+    torch.manual_seed(0)
+    print(f"{'model':<12}{'precision':<11}{'ms/frame':>10}{'speed-up':>10}{'ab error':>10}{'RGB error':>11}")
+    for name, factory in MODELS.items():
+        generator = factory(pretrained=args.pretrained)
+        reference = None
+        for precision in PRECISIONS:
+            colorizer = prepare_model(generator, precision, calibration)
+            out_ab = [colorizer(tens_l_rs) for _, tens_l_rs in inputs]
+            out_rgb = [postprocess_tens(tens_l, ab) * 255 for (tens_l, _), ab in zip(inputs, out_ab)]
+            elapsed = latency(colorizer, inputs[0][1], args.repeat)
+            if reference is None:
+                reference = elapsed, out_ab, out_rgb
+            ab_error = np.mean([(ab - ref).abs().mean().item() for ab, ref in zip(out_ab, reference[1])])
+            rgb_error = np.mean([np.abs(rgb - ref).mean() for rgb, ref in zip(out_rgb, reference[2])])
+            print(
+                f"{name:<12}{precision:<11}{elapsed:>10.1f}{reference[0] / elapsed:>9.2f}x"
+                f"{ab_error:>10.3f}{rgb_error:>11.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
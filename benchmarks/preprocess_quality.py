@@ -0,0 +1,87 @@
+"""
+Checks that converting once at full resolution and resizing only the L plane (preprocess_img(l_only=True), turned on
+with COLORIZERS_L_ONLY=1) colorizes within the ΔE2000 budgets of benchmarks.quality of the original path, which
+resizes the RGB image and converts it again.
+
+    python -m benchmarks.preprocess_quality
+    python -m benchmarks.preprocess_quality --images path/to/photos
+
+Runs on colour photographs, the ones bundled with scikit-image unless --images is given, with the released weights:
+a network with random weights predicts almost constant colors whatever its input, so --random-weights only checks
+that the benchmark runs and says nothing about the quality of either path.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+from skimage import data
+from skimage.color import deltaE_ciede2000, rgb2lab
+
+from benchmarks.quality import MAX_DELTA_E, MAX_DELTA_E_P95
+from models.deep_colorization import InferenceSession, eccv16, load_img, postprocess_tens, preprocess_img, siggraph17
+
+# colour photographs shipped with scikit-image, no download needed
+SAMPLE_IMAGES = ("astronaut", "chelsea", "coffee", "rocket", "hubble_deep_field", "immunohistochemistry")
+
+
+def sample_images() -> dict:
+    """
+    The colour photographs of scikit-image, by name
+    """
+    return {name: getattr(data, name)() for name in SAMPLE_IMAGES}
+
+
+def delta_e(colorizer, img: np.ndarray) -> np.ndarray:
+    """
+    Per-pixel ΔE2000 between the colorizations of img through the RGB resize path and through the L-only path
+    """
+    labs = []
+    for l_only in (False, True):
+        tens_l_orig, tens_l_rs = preprocess_img(img, HW=(256, 256), l_only=l_only)
+        labs.append(rgb2lab(np.clip(postprocess_tens(tens_l_orig, colorizer(tens_l_rs)), 0, 1)))
+    return deltaE_ciede2000(labs[0], labs[1])
+
+
+def main():
+    """
+    Print the ΔE2000 between both preprocessing paths for every image and model, exit with status 1 over budget
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, help="directory of colour images, scikit-image's samples otherwise")
+    parser.add_argument("--random-weights", action="store_true", help="smoke test without the released weights")
+    parser.add_argument("--max-delta-e", type=float, default=MAX_DELTA_E, help="budget of the mean ΔE2000")
+    parser.add_argument("--max-delta-e-p95", type=float, default=MAX_DELTA_E_P95, help="budget of the p95 ΔE2000")
+    args = parser.parse_args()
+
+    if args.images:
+        images = {path.name: load_img(path)[:, :, :3] for path in sorted(args.images.iterdir()) if path.is_file()}
+    else:
+        images = sample_images()
+
+    torch.manual_seed(0)
+    failed = False
+    print(f"{'model':<12}{'image':<24}{'mean ΔE':>9}{'p95 ΔE':>9}{'max ΔE':>9}")
+    for model, factory in (("ECCV16", eccv16), ("SIGGRAPH17", siggraph17)):
+        colorizer = InferenceSession(factory(pretrained=not args.random_weights))
+        for name, img in images.items():
+            diff = delta_e(colorizer, img)
+            mean, p95 = diff.mean(), np.percentile(diff, 95)
+            over = mean > args.max_delta_e or p95 > args.max_delta_e_p95
+            failed |= over
+            flag = "  OVER BUDGET" if over else ""
+            print(f"{model:<12}{name:<24}{mean:>9.3f}{p95:>9.3f}{diff.max():>9.2f}{flag}")
+
+    print(
+        "FAIL" if failed else "OK",
+        f"(budgets: mean ΔE2000 <= {args.max_delta_e}, p95 <= {args.max_delta_e_p95})",
+    )
+    if args.random_weights:
+        print("random weights: this only checks that the benchmark runs, not the quality of the L-only path")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
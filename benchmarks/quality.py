@@ -0,0 +1,304 @@
+"""
+Measures how far an optimized variant of the pipeline (reduced precision, TorchScript, frame reuse, tiled
+high-resolution inference, ...) moves the colors away from the reference pipeline, next to its throughput, and
+rejects it when it is over budget.
+
+The reference (fp32, eager, batch-norms not folded, every frame colorized) first records golden outputs of a local
+corpus of images and videos:
+
+    python -m benchmarks.quality corpus/ golden/ --record --model ECCV16 --pretrained
+
+then every variant is colorized and compared against them:
+
+    python -m benchmarks.quality corpus/ golden/ --precision bf16 --reuse keyframes --output report.json
+
+For every file it reports the mean and 95th percentile CIEDE2000 color difference (ΔE2000) to the golden output, its
+PSNR, and for videos the temporal flicker: the mean ΔE2000 between consecutive frames, beyond that of the golden
+frames. The exit status is 1 when a file is over one of the budgets. int8 calibrates on $COLORIZERS_CALIBRATION_DIR.
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from skimage.color import deltaE_ciede2000, rgb2lab
+
+from colorize import IMAGE_SUFFIXES, REUSE, find_inputs
+from models.deep_colorization import MODELS, PRECISIONS, InferenceSession, build
+from utils import BATCH_SIZE, TILED_WORKING_SIZE, colorize_frames, colorize_images, colorize_images_tiled
+from utils import read_frames
+
+MANIFEST = "manifest.json"
+
+# Budgets: mean ΔE2000 around 2 is barely perceptible side by side
+MAX_DELTA_E = 2.0
+MAX_DELTA_E_P95 = 6.0
+MIN_PSNR = 30.0
+MAX_FLICKER = 0.5
+
+
+def to_uint8(image: np.ndarray) -> np.ndarray:
+    """
+    uint8 version of an RGB image with values in [0, 1], uint8 images are returned as they are
+    """
+    return image if image.dtype == np.uint8 else (image * 255).astype(np.uint8)
+
+
+def read_video(path: Path, frames: int) -> tuple:
+    """
+    The first frames frames of the video at path and its frame rate
+    """
+    video = cv2.VideoCapture(str(path))
+    if not video.isOpened():
+        raise ValueError(f"cannot open {path}")
+    fps = video.get(cv2.CAP_PROP_FPS)
+    decoded = [frame for _, frame in zip(range(frames), read_frames(video))]
+    video.release()
+    return decoded, fps
+
+
+def colorize_corpus(corpus: Path, files: list, colorizer, args) -> dict:
+    """
+    Colorizes the corpus files named by their path relative to corpus, returns {name: (uint8 frames, seconds)}
+    """
+    outputs = {}
+    images = [name for name in files if Path(name).suffix.lower() in IMAGE_SUFFIXES]
+    videos = [name for name in files if name not in images]
+
+    if images:
+        paths = [corpus / name for name in images]
+        start = time.perf_counter()
+        if args.high_resolution:
+            colorized = colorize_images_tiled(paths, colorizer, working_size=args.working_size)
+        else:
+            colorized = colorize_images(paths, colorizer, batch_size=args.batch_size)
+        results = {}
+        for index, _, out_img in colorized:
+            if isinstance(out_img, Exception):
+                raise ValueError(f"{images[index]}: {out_img}")
+            results[index] = to_uint8(out_img)
+        # images are colorized together, their time is shared evenly
+        seconds = (time.perf_counter() - start) / len(images)
+        outputs.update({name: (results[index][None], seconds) for index, name in enumerate(images)})
+
+    for name in videos:
+        frames, _ = read_video(corpus / name, args.frames)
+        if not frames:
+            raise ValueError(f"{name}: no frames could be decoded")
+        reuse = REUSE[args.reuse]() if REUSE[args.reuse] else None
+        start = time.perf_counter()
+        colorized = np.stack([to_uint8(frame) for frame in colorize_frames(frames, colorizer, args.batch_size, reuse)])
+        outputs[name] = colorized, time.perf_counter() - start
+    return outputs
+
+
+def golden_path(golden: Path, name: str) -> Path:
+    """
+    Where the golden output of the corpus file name is stored: a PNG for images, a compressed NumPy archive of the
+    frames for videos
+    """
+    suffix = ".png" if Path(name).suffix.lower() in IMAGE_SUFFIXES else ".npz"
+    return golden / (name + suffix)
+
+
+def save_golden(path: Path, frames: np.ndarray):
+    """
+    Writes the golden frames of one corpus file losslessly
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".png":
+        Image.fromarray(frames[0]).save(path)
+    else:
+        np.savez_compressed(path, frames=frames)
+
+
+def load_golden(path: Path) -> np.ndarray:
+    """
+    N x H x W x 3 uint8 golden frames of one corpus file
+    """
+    if path.suffix == ".png":
+        return np.asarray(Image.open(path).convert("RGB"))[None]
+    with np.load(path) as archive:
+        return archive["frames"]
+
+
+def psnr(mse: float) -> float:
+    """
+    Peak signal-to-noise ratio of uint8 images with mean squared error mse, infinite for identical images
+    """
+    return 10 * math.log10(255**2 / mse) if mse > 0 else math.inf
+
+
+def flicker(labs: list) -> float:
+    """
+    Mean ΔE2000 between consecutive frames given in Lab, 0 for a single frame
+    """
+    if len(labs) < 2:
+        return 0.0
+    return float(np.mean([deltaE_ciede2000(previous, lab).mean() for previous, lab in zip(labs, labs[1:])]))
+
+
+def compare(frames: np.ndarray, golden: np.ndarray) -> dict:
+    """
+    Color difference, PSNR and added flicker of colorized frames against their golden frames
+    """
+    if frames.shape != golden.shape:
+        raise ValueError(f"output has shape {frames.shape}, the golden output {golden.shape}")
+    labs = [rgb2lab(frame) for frame in frames]
+    golden_labs = [rgb2lab(frame) for frame in golden]
+    delta_e = [deltaE_ciede2000(lab, golden_lab) for lab, golden_lab in zip(labs, golden_labs)]
+    mse = np.mean([np.mean((frame.astype(np.float32) - ref) ** 2) for frame, ref in zip(frames, golden)])
+    return {
+        "delta_e": float(np.mean(delta_e)),
+        "delta_e_p95": float(np.mean([np.percentile(frame_delta_e, 95) for frame_delta_e in delta_e])),
+        "psnr": psnr(float(mse)),
+        "flicker": flicker(labs) - flicker(golden_labs),
+    }
+
+
+def over_budget(result: dict, args) -> list:
+    """
+    The budgets result does not meet
+    """
+    failed = []
+    if result["delta_e"] > args.max_delta_e:
+        failed.append("delta_e")
+    if result["delta_e_p95"] > args.max_delta_e_p95:
+        failed.append("delta_e_p95")
+    if result["psnr"] < args.min_psnr:
+        failed.append("psnr")
+    if result["flicker"] > args.max_flicker:
+        failed.append("flicker")
+    return failed
+
+
+def record(corpus: Path, golden: Path, args):
+    """
+    Colorizes the corpus with the reference pipeline and stores its outputs and throughput as the golden outputs
+    """
+    paths, _ = find_inputs([str(corpus)], recursive=True)
+    files = [relative.as_posix() for relative in paths.values()]
+    if not files:
+        sys.exit(f"no image or video in {corpus}")
+
+    torch.manual_seed(0)
+    colorizer = InferenceSession(MODELS[args.model](pretrained=args.pretrained))
+    args.high_resolution, args.reuse = False, "none"
+    outputs = colorize_corpus(corpus, files, colorizer, args)
+
+    manifest = {"model": args.model, "pretrained": args.pretrained, "frames": args.frames, "files": {}}
+    for name, (frames, seconds) in outputs.items():
+        save_golden(golden_path(golden, name), frames)
+        manifest["files"][name] = {"frames": len(frames), "seconds": seconds}
+        print(f"{name}: {len(frames)} frame(s), {len(frames) / seconds:.2f} frames/s")
+    with open(golden / MANIFEST, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+
+def check(corpus: Path, golden: Path, args) -> int:
+    """
+    Colorizes the corpus with the variant given on the command line, prints how it compares with the golden outputs
+    and returns the number of files over budget
+    """
+    with open(golden / MANIFEST, encoding="utf-8") as file:
+        manifest = json.load(file)
+    args.frames = manifest["frames"]
+
+    # the same seed as the reference gives the same random weights
+    torch.manual_seed(0)
+    colorizer = build(manifest["model"], args.precision, pretrained=manifest["pretrained"], compiled=args.compiled)
+    outputs = colorize_corpus(corpus, list(manifest["files"]), colorizer, args)
+
+    results = []
+    print(f"{'file':<32}{'fps':>8}{'speed-up':>10}{'ΔE2000':>9}{'ΔE p95':>9}{'PSNR':>8}{'flicker':>9}")
+    for name, (frames, seconds) in outputs.items():
+        reference = manifest["files"][name]
+        result = {
+            "file": name,
+            "frames": len(frames),
+            "frames_per_second": len(frames) / seconds,
+            "speed_up": reference["seconds"] / seconds,
+            **compare(frames, load_golden(golden_path(golden, name))),
+        }
+        result["over_budget"] = over_budget(result, args)
+        results.append(result)
+        flag = f"  OVER BUDGET ({', '.join(result['over_budget'])})" if result["over_budget"] else ""
+        print(
+            f"{name:<32}{result['frames_per_second']:>8.2f}{result['speed_up']:>9.2f}x{result['delta_e']:>9.2f}"
+            f"{result['delta_e_p95']:>9.2f}{result['psnr']:>8.1f}{result['flicker']:>+9.2f}{flag}"
+        )
+
+    frames = sum(result["frames"] for result in results)
+    seconds = sum(outputs[name][1] for name in outputs)
+    reference_seconds = sum(manifest["files"][name]["seconds"] for name in outputs)
+    print(f"{frames} frames at {frames / seconds:.2f} frames/s, {reference_seconds / seconds:.2f}x the reference")
+
+    if args.output:
+        variant = {
+            "precision": args.precision,
+            "compiled": args.compiled,
+            "reuse": args.reuse,
+            "high_resolution": args.high_resolution,
+            "batch_size": args.batch_size,
+        }
+        budget = {
+            "max_delta_e": args.max_delta_e,
+            "max_delta_e_p95": args.max_delta_e_p95,
+            "min_psnr": args.min_psnr,
+            "max_flicker": args.max_flicker,
+        }
+        report = {
+            "model": manifest["model"],
+            "variant": variant,
+            "budget": budget,
+            "frames_per_second": frames / seconds,
+            "speed_up": reference_seconds / seconds,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    return sum(1 for result in results if result["over_budget"])
+
+
+def main():
+    """
+    Record the golden outputs of a corpus, or check a variant against them
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, help="directory of images and videos")
+    parser.add_argument("golden", type=Path, help="directory of the golden outputs")
+    parser.add_argument("--record", action="store_true", help="record the golden outputs with the reference pipeline")
+    parser.add_argument("--model", choices=list(MODELS), default="ECCV16", help="model of the golden outputs")
+    parser.add_argument("--pretrained", action="store_true", help="use the released weights instead of random ones")
+    parser.add_argument("--frames", type=int, default=60, help="number of frames colorized from every video")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32")
+    parser.add_argument("--compiled", action="store_true", help="run the fp32 model with TorchScript")
+    parser.add_argument("--reuse", choices=list(REUSE), default="none", help="frame reuse strategy for videos")
+    parser.add_argument("--high-resolution", action="store_true", help="colorize images with tiled inference")
+    parser.add_argument("--working-size", type=int, default=TILED_WORKING_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-delta-e", type=float, default=MAX_DELTA_E, help="budget of the mean ΔE2000")
+    parser.add_argument("--max-delta-e-p95", type=float, default=MAX_DELTA_E_P95, help="budget of the p95 ΔE2000")
+    parser.add_argument("--min-psnr", type=float, default=MIN_PSNR, help="budget of the PSNR, in dB")
+    parser.add_argument("--max-flicker", type=float, default=MAX_FLICKER, help="budget of the added flicker")
+    parser.add_argument("--output", help="JSON file the report is written to")
+    args = parser.parse_args()
+
+    if args.record:
+        args.golden.mkdir(parents=True, exist_ok=True)
+        record(args.corpus, args.golden, args)
+        return
+    over = check(args.corpus, args.golden, args)
+    print(f"{over} file(s) over budget")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Load test of the HTTP inference service (server.py): concurrent clients post the same image and the throughput and
+p50/p99 latencies are reported. By default it starts a local server with random weights twice, without
+micro-batching (--max-batch 1) and with it, to show what batching concurrent requests gains.
+
+    python -m benchmarks.serving --concurrency 16 --requests 128 --max-batch 16 --batch-window-ms 10
+    python -m benchmarks.serving --url http://127.0.0.1:8000/colorize/ECCV16
+
+Gains depend on the machine: batching helps most when a forward pass does not already keep every core busy.
+"""
+
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stages import encode_jpeg, synthetic_frames
+from models.deep_colorization import MODELS
+
+
+def free_port() -> int:
+    """
+    A TCP port nothing listens on
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def post(url: str, body: bytes) -> float:
+    """
+    Posts body to url, returns the latency in seconds
+    """
+    start = time.perf_counter()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "image/jpeg"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def load(url: str, body: bytes, requests: int, concurrency: int) -> dict:
+    """
+    Sends requests posts of body from concurrency clients, returns the throughput and client-side latencies
+    """
+    post(url, body)  # warm-up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(lambda _: post(url, body), range(requests)))) * 1000
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def stats(url: str) -> dict:
+    """
+    /stats of the server answering url
+    """
+    base = url.split("/colorize")[0]
+    with urllib.request.urlopen(f"{base}/stats", timeout=10) as response:
+        return json.load(response)
+
+
+def start_server(model: str, port: int, server_args: list) -> subprocess.Popen:
+    """
+    Starts python -m server with random weights and waits until it answers
+    """
+    command = [sys.executable, "-m", "server", "--random-weights", "--models", model, "--port", str(port)]
+    process = subprocess.Popen(command + server_args)
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"the server exited with status {process.returncode}")
+        try:
+            stats(f"http://127.0.0.1:{port}")
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("the server did not start")
+
+
+def main():
+    """
+    Print throughput and latencies with and without micro-batching, or against a running server
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="colorize endpoint of a running server, local servers are started otherwise")
+    parser.add_argument("--model", choices=list(MODELS), default="ECCV16")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients sending requests at the same time")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--size", type=int, nargs=2, default=(480, 640), metavar=("H", "W"), help="image size")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--batch-window-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    body = encode_jpeg(synthetic_frames(1, tuple(args.size))[0])
+    if args.url:
+        runs = [("server", args.url, None)]
+    else:
+        batching = ["--max-batch", str(args.max_batch), "--batch-window-ms", str(args.batch_window_ms)]
+        runs = [("no batching", ["--max-batch", "1"]), ("micro-batching", batching)]
+        runs = [(name, None, server_args) for name, server_args in runs]
+
+    print(f"{'mode':<16}{'req/s':>8}{'p50 ms':>10}{'p99 ms':>10}{'server p50':>12}{'server p99':>12}{'batch':>7}")
+    baseline = None
+    for name, url, server_args in runs:
+        process = None
+        if url is None:
+            port = free_port()
+            process = start_server(args.model, port, server_args)
+            url = f"http://127.0.0.1:{port}/colorize/{args.model}"
+        try:
+            result = load(url, body, args.requests, args.concurrency)
+            server = stats(url)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+        mean_batch = np.mean([model["mean_batch"] for model in server["models"].values()])
+        print(
+            f"{name:<16}{result['requests_per_second']:>8.2f}{result['p50_ms']:>10.0f}{result['p99_ms']:>10.0f}"
+            f"{server['p50_ms']:>12.0f}{server['p99_ms']:>12.0f}{mean_batch:>7.1f}"
+        )
+        baseline = baseline or result["requests_per_second"]
+    if len(runs) > 1:
+        print(f"micro-batching throughput: {result['requests_per_second'] / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
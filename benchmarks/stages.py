@@ -0,0 +1,223 @@
+"""
+Times every stage of the colorization pipeline on its own: decode, RGB -> L, resize to 256x256, the ECCV16 and
+SIGGRAPH17 forward passes, ab upsample, Lab -> RGB and encode, at several resolutions and batch sizes. Resizing is
+timed on both paths of preprocess_img: "resize" resizes the L planes (l_only, what the app runs) and "resize_rgb"
+resizes the RGB images with PIL before converting them to L (the default). "preprocess", "preprocess_rgb" and
+"postprocess" time preprocess_batch on both paths and postprocess_batch end to end. Models have random weights and
+frames are synthetic, so it runs offline. Results are written as JSON, and two result files can be
+compared to flag the stages that got slower.
+
+    python -m benchmarks.stages --output before.json
+    python -m benchmarks.stages --output after.json
+    python -m benchmarks.stages --compare before.json after.json --threshold 0.1
+
+--compare exits with status 1 when the median and best times of a stage are both slower by more than the threshold.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from models.deep_colorization import MODELS, build
+from models.deep_colorization.colorizers.colorspace import lab2rgb, rgb2l
+from models.deep_colorization.colorizers.util import postprocess_batch, preprocess_batch, resize_img, resize_l
+
+RESOLUTIONS = {"480p": (480, 854), "720p": (720, 1280), "1080p": (1080, 1920)}
+
+# the forward passes always run at the network resolution
+NETWORK_HW = (256, 256)
+
+
+def synthetic_frames(batch_size: int, HW: tuple) -> np.ndarray:
+    """
+    N x H x W x 3 uint8 grayscale frames with smooth structure and some noise
+    """
+    rng = np.random.default_rng(0)
+    y = np.linspace(0, 6 * np.pi, HW[0], dtype=np.float32)[:, None]
+    x = np.linspace(0, 6 * np.pi, HW[1], dtype=np.float32)[None, :]
+    frames = []
+    for i in range(batch_size):
+        gray = 128 + 60 * np.sin(x + i) * np.cos(y) + rng.normal(0, 8, HW)
+        frames.append(np.repeat(gray.clip(0, 255).astype(np.uint8)[:, :, None], 3, axis=2))
+    return np.stack(frames)
+
+
+def encode_jpeg(image: np.ndarray) -> bytes:
+    """
+    JPEG bytes of an H x W x 3 uint8 image, at PIL's default quality like the app
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def timings(fn, repeat: int) -> list:
+    """
+    Wall-clock times of repeat calls of fn after a warm-up call, in milliseconds
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def pre_and_post_stages(batch_size: int, HW: tuple) -> dict:
+    """
+    The stages that depend on the frame resolution, as functions of no argument over prepared inputs
+    """
+    frames = synthetic_frames(batch_size, HW)
+    jpegs = [encode_jpeg(frame) for frame in frames]
+    tens_l = torch.from_numpy(rgb2l(frames))[:, None, :, :]
+    out_ab = torch.randn(batch_size, 2, *NETWORK_HW) * 20
+    out_lab = torch.cat((tens_l, F.interpolate(out_ab, size=HW, mode="bilinear")), dim=1)
+    out_lab = out_lab.numpy().transpose((0, 2, 3, 1))
+    out_rgb = [(lab2rgb(lab) * 255).astype(np.uint8) for lab in out_lab]
+
+    return {
+        "decode": lambda: [np.asarray(Image.open(io.BytesIO(jpeg)).convert("RGB")) for jpeg in jpegs],
+        "rgb2l": lambda: rgb2l(frames),
+        "resize": lambda: resize_l(tens_l, HW=NETWORK_HW),
+        "resize_rgb": lambda: [rgb2l(resize_img(frame, HW=NETWORK_HW)) for frame in frames],
+        "preprocess": lambda: preprocess_batch(list(frames), HW=NETWORK_HW, l_only=True),
+        "preprocess_rgb": lambda: preprocess_batch(list(frames), HW=NETWORK_HW),
+        "ab_upsample": lambda: F.interpolate(out_ab, size=HW, mode="bilinear"),
+        "lab2rgb": lambda: [lab2rgb(lab) for lab in out_lab],
+        "encode": lambda: [encode_jpeg(image) for image in out_rgb],
+        "postprocess": lambda: postprocess_batch(list(tens_l.split(1)), out_ab),
+    }
+
+
+def forward_stages(batch_size: int, colorizers: dict) -> dict:
+    """
+    The forward pass of every model on a batch of 256x256 L planes
+    """
+    tens_l_rs = torch.rand(batch_size, 1, *NETWORK_HW) * 100
+    return {
+        f"forward_{name.lower()}": lambda colorizer=colorizer: colorizer(tens_l_rs)
+        for name, colorizer in colorizers.items()
+    }
+
+
+def run(args) -> dict:
+    """
+    Times every stage at every resolution and batch size, returns the results with a description of the machine
+    """
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    colorizers = {name: build(name, pretrained=False) for name in args.models}
+
+    results = []
+
+    def record(stage, resolution, batch_size, fn):
+        times = timings(fn, args.repeat)
+        median = statistics.median(times)
+        results.append(
+            {
+                "stage": stage,
+                "resolution": resolution,
+                "batch_size": batch_size,
+                "median_ms": median,
+                "min_ms": min(times),
+                "per_frame_ms": median / batch_size,
+            }
+        )
+        print(f"{stage:<22}{resolution:<10}{batch_size:>6}{median:>12.2f}{median / batch_size:>12.2f}", flush=True)
+
+    print(f"{'stage':<22}{'size':<10}{'batch':>6}{'median ms':>12}{'ms/frame':>12}")
+    for batch_size in args.batch_sizes:
+        for stage, fn in forward_stages(batch_size, colorizers).items():
+            record(stage, f"{NETWORK_HW[0]}x{NETWORK_HW[1]}", batch_size, fn)
+        for resolution in args.resolutions:
+            for stage, fn in pre_and_post_stages(batch_size, RESOLUTIONS[resolution]).items():
+                record(stage, resolution, batch_size, fn)
+
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def compare(before: dict, after: dict, threshold: float) -> int:
+    """
+    Prints the change of the median time of every stage found in both runs, returns the number of regressions:
+    stages whose median and best times both grew by more than threshold
+    """
+    key = lambda result: (result["stage"], result["resolution"], result["batch_size"])  # noqa: E731
+    baseline = {key(result): result for result in before["results"]}
+    if before.get("machine") != after.get("machine"):
+        print("warning: the runs come from different machines or library versions", file=sys.stderr)
+
+    regressions = 0
+    print(f"{'stage':<22}{'size':<10}{'batch':>6}{'before ms':>12}{'after ms':>12}{'change':>9}")
+    for result in after["results"]:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        change = result["median_ms"] / old["median_ms"] - 1
+        # the best time must have moved as well, a single slow repeat shifts the median of a short run
+        best_change = result["min_ms"] / old["min_ms"] - 1
+        flag = ""
+        if change > threshold and best_change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold and best_change < -threshold:
+            flag = "  faster"
+        print(
+            f"{result['stage']:<22}{result['resolution']:<10}{result['batch_size']:>6}"
+            f"{old['median_ms']:>12.2f}{result['median_ms']:>12.2f}{change:>+9.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    """
+    Run the suite and write its results, or compare two result files
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slow-down flagged as a regression")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, help="torch threads, torch's default when not given")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as before, open(args.compare[1], encoding="utf-8") as after:
+            regressions = compare(json.load(before), json.load(after), args.threshold)
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
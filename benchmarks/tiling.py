@@ -0,0 +1,83 @@
+"""
+Throughput and peak RSS of colorizing large stills: the default path (the whole image squashed to 256x256, ab
+upsampled bilinearly), tiled inference at a working resolution, and optionally the model run at native resolution.
+Every run happens in a fresh process so that its peak RSS is its own.
+
+    python -m benchmarks.tiling --sizes 4k 8k --pretrained
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from models.deep_colorization import MODELS, InferenceSession, postprocess_tens, preprocess_img
+from models.deep_colorization.colorizers import colorize_tiled
+
+SIZES = {"1080p": (1920, 1080), "4k": (3840, 2160), "8k": (7680, 4320)}
+MODES = ("resize", "tiled", "native")
+
+
+def synthetic_image(width: int, height: int) -> np.ndarray:
+    """
+    Gray H x W x 3 uint8 image with smooth structure and some noise
+    """
+    y = np.linspace(0, 8 * np.pi, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 8 * np.pi, width, dtype=np.float32)[None, :]
+    gray = 128 + 60 * np.sin(x) * np.cos(y) + np.random.default_rng(0).normal(0, 8, (height, width))
+    return np.repeat(gray.clip(0, 255).astype(np.uint8)[:, :, None], 3, axis=2)
+
+
+def run(mode: str, size: str, model: str, pretrained: bool, working_size: int):
+    """
+    Colorizes one synthetic image in this process, prints seconds and peak RSS in MiB
+    """
+    colorizer = InferenceSession(MODELS[model](pretrained=pretrained))
+    img = synthetic_image(*SIZES[size])
+    start = time.perf_counter()
+    if mode == "tiled":
+        colorize_tiled(img, colorizer, working_size=working_size)
+    else:
+        tens_l_orig, tens_l_rs = preprocess_img(img, HW=(256, 256) if mode == "resize" else img.shape[:2], l_only=True)
+        postprocess_tens(tens_l_orig, colorizer(tens_l_rs if mode == "resize" else tens_l_orig))
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def main():
+    """
+    Print seconds, megapixels per second and peak RSS of every mode and size
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["4k", "8k"])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["resize", "tiled"])
+    parser.add_argument("--model", choices=list(MODELS), default="ECCV16")
+    parser.add_argument("--pretrained", action="store_true", help="use the released weights instead of random ones")
+    parser.add_argument("--working-size", type=int, default=1024)
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(*args.run, args.model, args.pretrained, args.working_size)
+        return
+
+    print(f"{'size':<8}{'mode':<10}{'seconds':>10}{'MP/s':>8}{'peak RSS MiB':>14}")
+    for size in args.sizes:
+        megapixels = SIZES[size][0] * SIZES[size][1] / 1e6
+        for mode in args.modes:
+            command = [sys.executable, "-m", "benchmarks.tiling", "--run", mode, size, "--model", args.model]
+            command += ["--working-size", str(args.working_size)] + (["--pretrained"] if args.pretrained else [])
+            result = subprocess.run(command, capture_output=True, text=True, check=False)
+            if result.returncode != 0:
+                print(f"{size:<8}{mode:<10}{'failed (exit ' + str(result.returncode) + ')':>32}")
+                continue
+            elapsed, peak = map(float, result.stdout.split()[-2:])
+            print(f"{size:<8}{mode:<10}{elapsed:>10.2f}{megapixels / elapsed:>8.2f}{peak:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Colorizes images and videos from the command line, without starting the Streamlit app.
+
+    python -m colorize photos/ "scans/*.tif" film.mp4 --output-dir colorized --model SIGGRAPH17
+
+Inputs are image or video files, directories (their images and videos) and glob patterns. Results are written to
+the output directory as soon as they are ready, at the path of their input relative to the directory or pattern that
+named it: photos/trip/beach.jpg becomes colorized/trip/beach_colorized.png. Inputs that would share an output, such as
+beach.jpg and beach.png, fail instead of overwriting each other.
+
+Exit status: 0 when every input was colorized, 1 when some of them failed, 2 on usage errors.
+"""
+
+import argparse
+import collections
+import glob
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+import metrics
+from models.deep_colorization import MODELS, PRECISIONS
+from utils import BATCH_SIZE, COMPILED, PRECISION, TILED_WORKING_SIZE, build_model, colorize_images
+from utils import colorize_images_tiled, to_pil
+from video import (
+    FFmpegWriter,
+    KeyframePropagator,
+    StaticFrameCache,
+    colorize_video,
+    colorize_video_parallel,
+    frame_size,
+)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+VIDEO_SUFFIXES = (".mp4", ".mov", ".avi", ".mkv")
+
+# Output formats, videos are encoded to H.264 with the audio of their input in either container
+IMAGE_FORMATS = ("png", "jpg")
+VIDEO_FORMATS = ("mp4", "mkv")
+
+# Frame reuse strategies of the video pages, by command-line name
+REUSE = {"none": None, "static": StaticFrameCache, "keyframes": KeyframePropagator}
+
+
+def pattern_root(pattern: str) -> Path:
+    """
+    Directory a glob pattern starts from: its leading components without wildcards
+    """
+    parts = list(itertools.takewhile(lambda part: not glob.has_magic(part), Path(pattern).parts))
+    return Path(*parts) if parts else Path(".")
+
+
+def find_inputs(patterns, recursive: bool = False) -> tuple:
+    """
+    Expands files, directories and glob patterns into the image and video files they name, in order and without
+    duplicates. Returns ({file: its path relative to the directory or pattern that named it}, patterns that matched
+    nothing). A file given as it is has its name as relative path.
+    """
+    files, missing = {}, []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(path.rglob("*") if recursive else path.iterdir())
+            matches = [match for match in matches if match.suffix.lower() in IMAGE_SUFFIXES + VIDEO_SUFFIXES]
+            root = path
+        elif path.is_file():
+            matches = [path]
+            root = path.parent
+        else:
+            matches = [Path(match) for match in sorted(glob.glob(pattern, recursive=recursive))]
+            matches = [match for match in matches if match.is_file()]
+            root = pattern_root(pattern)
+        if not matches:
+            missing.append(pattern)
+        for match in matches:
+            if match.is_file():
+                files.setdefault(match, match.relative_to(root))
+    return files, missing
+
+
+def output_path(relative: Path, output_dir: Path, extension: str) -> Path:
+    """
+    Where the colorized version of the input at relative (see find_inputs) is written: the same place under
+    output_dir, so that inputs of the same name in different directories do not collide
+    """
+    return output_dir / relative.parent / f"{relative.stem}_colorized.{extension}"
+
+
+def colliding_outputs(outputs: dict) -> dict:
+    """
+    The inputs of {input: output path} whose output path is also the one of another input, with those other inputs
+    """
+    by_output = collections.defaultdict(list)
+    for path, out_path in outputs.items():
+        by_output[out_path].append(path)
+    return {
+        path: [other for other in paths if other != path]
+        for paths in by_output.values()
+        if len(paths) > 1
+        for path in paths
+    }
+
+
+def save_image(image: np.ndarray, path: Path):
+    """
+    Writes an RGB image, uint8 or with values in [0, 1], to path, through a temporary file so that partial outputs
+    never exist
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    to_pil(image).save(tmp_path, format=Image.registered_extensions()[path.suffix])
+    os.replace(tmp_path, path)
+
+
+def _map_bounded(fn, items, workers: int):
+    """
+    Yields (item, fn(item) or the exception it raised) in order, with at most 2 * workers calls in flight
+    """
+
+    def call(item):
+        try:
+            return fn(item)
+        except Exception as e:  # pylint: disable=broad-except
+            return e
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            pending.append((item, executor.submit(call, item)))
+            if len(pending) >= 2 * workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def colorize_image_files(paths, out_paths, colorizer, args):
+    """
+    Colorizes images with utils.colorize_images, or colorize_images_tiled in high-resolution mode, and encodes the
+    results to out_paths in workers threads. Yields (path, exception or None) for every image once its output is
+    written.
+    """
+
+    def save(result):
+        index, _, out_img = result
+        if isinstance(out_img, Exception):
+            raise out_img
+        save_image(out_img, out_paths[index])
+
+    if args.high_resolution:
+        colorized = colorize_images_tiled(paths, colorizer, working_size=args.working_size)
+    else:
+        colorized = colorize_images(paths, colorizer, batch_size=args.batch_size, workers=args.workers)
+    for (index, _, _), error in _map_bounded(save, colorized, args.workers):
+        yield paths[index], error
+
+
+def colorize_video_file(path: Path, out_path: Path, args, colorizer, fmt: str) -> int:
+    """
+    Colorizes the video at path into out_path, returns the number of frames written
+    """
+    video = cv2.VideoCapture(str(path))
+    if not video.isOpened():
+        raise ValueError("cannot open video")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f".{out_path.name}.tmp.{fmt}")
+    writer = FFmpegWriter(tmp_path, video.get(cv2.CAP_PROP_FPS), frame_size(video), audio_source=path)
+    frames_completed = 0
+    try:
+        reuse = REUSE[args.reuse]() if REUSE[args.reuse] else None
+        if args.workers > 1:
+            colorized = colorize_video_parallel(
+                video,
+                writer,
+                args.model,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                reuse=reuse,
+                precision=args.precision,
+            )
+        else:
+            colorized = colorize_video(video, writer, colorizer, batch_size=args.batch_size, reuse=reuse)
+        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        for frames_completed in tqdm(colorized, total=total_frames, unit="frame", desc=path.name, leave=False):
+            pass
+        video.release()
+        if frames_completed == 0:
+            raise ValueError("no frames could be decoded")
+        writer.release()
+    except BaseException:
+        video.release()
+        try:
+            writer.release()
+        except RuntimeError:
+            pass
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, out_path)
+    return frames_completed
+
+
+def report_metrics(job: metrics.Job):
+    """
+    Prints the summary of a job to stderr as one line of JSON, when metrics are on
+    """
+    summary = job.summary()
+    if summary:
+        print(json.dumps(summary), file=sys.stderr)
+
+
+def parse_args(argv=None):
+    """
+    Command-line arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m colorize", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("inputs", nargs="+", help="image or video files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("colorized"))
+    parser.add_argument("-m", "--model", choices=list(MODELS), default="ECCV16")
+    parser.add_argument("-b", "--batch-size", type=int, default=BATCH_SIZE, help="images or frames per forward pass")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="threads decoding, post-processing and encoding images, or processes colorizing each video if above 1",
+    )
+    parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+    parser.add_argument("--compiled", action="store_true", default=COMPILED, help="run fp32 models with TorchScript")
+    parser.add_argument(
+        "--high-resolution",
+        action="store_true",
+        help="colorize images as overlapping tiles of a working resolution instead of a 256x256 version of them",
+    )
+    parser.add_argument(
+        "--working-size",
+        type=int,
+        default=TILED_WORKING_SIZE,
+        help="long side of the working resolution of --high-resolution",
+    )
+    parser.add_argument("--image-format", choices=IMAGE_FORMATS, default="png")
+    parser.add_argument("--video-format", choices=VIDEO_FORMATS, default="mp4")
+    parser.add_argument("--reuse", choices=list(REUSE), default="none", help="frame reuse strategy for videos")
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into subdirectories")
+    parser.add_argument("--overwrite", action="store_true", help="colorize inputs whose output already exists")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="record stage timings, write them to FILE in the Prometheus text format and print a summary per job",
+    )
+    args = parser.parse_args(argv)
+    if args.batch_size < 1 or args.workers < 1:
+        parser.error("--batch-size and --workers must be positive")
+    if args.compiled and args.precision != "fp32":
+        parser.error("--compiled runs fp32 models only")
+    return args
+
+
+def main(argv=None) -> int:
+    """
+    Colorizes the inputs given on the command line, returns the exit status
+    """
+    args = parse_args(argv)
+    files, missing = find_inputs(args.inputs, args.recursive)
+    for pattern in missing:
+        print(f"colorize: no image or video matches {pattern}", file=sys.stderr)
+    if not files:
+        return EXIT_USAGE
+
+    outputs = {
+        path: output_path(
+            relative, args.output_dir, args.image_format if path.suffix.lower() in IMAGE_SUFFIXES else args.video_format
+        )
+        for path, relative in files.items()
+    }
+    # e.g. photo.jpg and photo.png, or the same name under two of the inputs: neither is colorized rather than one
+    # silently overwriting the other, or being skipped because the other exists
+    collisions = colliding_outputs(outputs)
+    for path, others in collisions.items():
+        print(
+            f"colorize: {path}: same output {outputs[path]} as {', '.join(map(str, others))}, rename one of them",
+            file=sys.stderr,
+        )
+    failed = len(collisions)
+
+    images = [path for path in files if path.suffix.lower() in IMAGE_SUFFIXES and path not in collisions]
+    videos = [path for path in files if path.suffix.lower() in VIDEO_SUFFIXES and path not in collisions]
+    if not args.overwrite:
+        images = [path for path in images if not outputs[path].exists()]
+        videos = [path for path in videos if not outputs[path].exists()]
+    skipped = len(files) - len(collisions) - len(images) - len(videos)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.metrics:
+        metrics.enable(metrics_file=args.metrics)
+
+    colorizer = build_model(args.model, args.precision, compiled=args.compiled)
+    done = 0
+    if images:
+        with metrics.Job("images") as job:
+            for path, error in tqdm(
+                colorize_image_files(images, [outputs[path] for path in images], colorizer, args),
+                total=len(images),
+                unit="image",
+                disable=args.quiet,
+            ):
+                if error is not None:
+                    failed += 1
+                    tqdm.write(f"colorize: {path}: {error}", file=sys.stderr)
+                else:
+                    done += 1
+        report_metrics(job)
+
+    for path in videos:
+        out_path = outputs[path]
+        try:
+            with metrics.Job("video") as job:
+                frames = colorize_video_file(path, out_path, args, colorizer, args.video_format)
+        except Exception as e:  # pylint: disable=broad-except
+            failed += 1
+            print(f"colorize: {path}: {e}", file=sys.stderr)
+            continue
+        finally:
+            report_metrics(job)
+        done += 1
+        if not args.quiet:
+            print(f"{path} -> {out_path} ({frames} frames)")
+
+    if not args.quiet:
+        print(f"{done} colorized, {failed} failed, {skipped} skipped (output exists)")
+    return EXIT_FAILED if failed or missing else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
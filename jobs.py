@@ -0,0 +1,185 @@
+"""
+Background jobs: colorizations run on a fixed pool of threads shared by every page and session instead of the
+Streamlit script thread, so a rerun of the page does not lose them and the number of jobs running at the same time
+is bounded.
+
+The work of a job is a generator function taking the Job: it yields the number of frames completed so far, may set
+job.total, and returns the result of the job. Cancelling a running job closes the generator at its next yield.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs running at the same time, and jobs waiting for a free worker before new ones are turned away
+JOB_WORKERS = int(os.environ.get("COLORIZE_JOB_WORKERS", "1"))
+MAX_QUEUED_JOBS = int(os.environ.get("COLORIZE_MAX_QUEUED_JOBS", "4"))
+
+# Seconds a finished job, and the files it owns, are kept for its session to pick up the result
+JOB_TTL = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobRejected(RuntimeError):
+    """
+    Raised by JobManager.submit when every worker is busy and the queue is full
+    """
+
+
+class Job:
+    """
+    State of a background job, updated by the worker running it and read by the sessions polling it
+    """
+
+    def __init__(self, kind: str, total: int = 0, files=()):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.total = total
+        self.completed = 0
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        # files deleted with the job once it expires
+        self.files = list(files)
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the job completed, from 0 to 1
+        """
+        if self.status == DONE:
+            return 1.0
+        return min(self.completed / self.total, 1.0) if self.total > 0 else 0.0
+
+    @property
+    def seconds_remaining(self):
+        """
+        Estimated seconds until the job is done, None until it has completed some frames
+        """
+        if self.status != RUNNING or not self.completed or not self.total:
+            return None
+        elapsed = time.time() - self.started
+        return max(self.total - self.completed, 0) / self.completed * elapsed
+
+
+class JobManager:
+    """
+    Runs jobs on workers threads in submission order. At most workers + max_queued jobs are admitted at a time,
+    the others are rejected so that a burst of sessions cannot queue unbounded work. Finished jobs are forgotten ttl
+    seconds after they end.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = MAX_QUEUED_JOBS, ttl: float = JOB_TTL):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="colorize-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, work, kind: str = "video", total: int = 0, files=()) -> Job:
+        """
+        Queues work(job) and returns the job, raises JobRejected when too many jobs are admitted already.
+        files are deleted with the job once it expires, as are the files work adds to job.files.
+        """
+        self._expire()
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.status not in FINISHED)
+            if active >= self.workers + self.max_queued:
+                raise JobRejected(f"{active} jobs are running or queued, try again later")
+            job = Job(kind, total, files)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id: str):
+        """
+        The job called job_id, None once it expired. Sessions poll their job through get, so expired jobs are also
+        forgotten here and not only when new jobs are submitted.
+        """
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """
+        Number of queued jobs submitted before job
+        """
+        with self._lock:
+            return sum(1 for other in self._jobs.values() if other.status == QUEUED and other.created < job.created)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a queued job, or asks a running one to stop at its next frame. Returns False if it already finished.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel_requested.set()
+        if job.future.cancel():
+            job.status = CANCELLED
+            job.finished = time.time()
+        return True
+
+    def _run(self, job: Job, work):
+        """
+        Runs work in a worker thread, recording its progress, result or error in job
+        """
+        if job.cancel_requested.is_set():
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        generator = work(job)
+        try:
+            while True:
+                if job.cancel_requested.is_set():
+                    generator.close()
+                    job.status = CANCELLED
+                    break
+                job.completed = next(generator)
+        except StopIteration as stop:
+            job.result = stop.value
+            job.status = DONE
+        except Exception as e:  # pylint: disable=broad-except
+            job.error = str(e) or type(e).__name__
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+
+    def _expire(self):
+        """
+        Forgets the jobs that finished more than ttl seconds ago and deletes their files
+        """
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished and now - job.finished > self.ttl]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            for path in job.files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        """
+        Cancels every job and waits for the running ones to stop
+        """
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,345 @@
+"""
+Opt-in instrumentation of the colorization hot paths: per-stage latency histograms, frame counters, queue depths,
+frames per second and peak RSS, exported in the Prometheus text format and summarised per job.
+
+Metrics are off unless $COLORIZE_METRICS is set to 1 or enable() is called. While they are off, stage() returns a
+shared no-op context manager and the other recorders return immediately, so the instrumented code pays a function
+call per frame at most. When on, $COLORIZE_METRICS_FILE names a file rewritten at the end of every job, and
+$COLORIZE_METRICS_PORT an HTTP port serving /metrics, on $COLORIZE_METRICS_HOST (127.0.0.1 by default, set
+0.0.0.0 for a scraper on another machine).
+"""
+
+import bisect
+import contextlib
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENABLED = os.environ.get("COLORIZE_METRICS", "").lower() in ("1", "true", "yes")
+METRICS_FILE = os.environ.get("COLORIZE_METRICS_FILE")
+METRICS_PORT = os.environ.get("COLORIZE_METRICS_PORT")
+METRICS_HOST = os.environ.get("COLORIZE_METRICS_HOST", "127.0.0.1")
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL = contextlib.nullcontext()
+
+# Collectors of the jobs the current code runs for, innermost last (see Job)
+_JOB_COLLECTORS = contextvars.ContextVar("colorize_job_collectors", default=())
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with Prometheus buckets
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """
+        Records one observation
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Thread-safe store of histograms, counters and gauges, keyed by metric name and label values
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Adds value to the histogram name
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """
+        Adds amount to the counter name
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        """
+        Sets the gauge name to value
+        """
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, labels), value in sorted(metrics.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """
+        Writes render() to path through a temporary file, for node_exporter's textfile collector
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _labels(labels) -> str:
+    """
+    Prometheus label set of a tuple of (name, value) pairs
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+def peak_rss_bytes() -> int:
+    """
+    Peak resident set size of this process so far, 0 where the platform does not report it
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    """
+    Context manager adding its wall-clock time to the histogram of its stage
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        REGISTRY.observe("colorize_stage_seconds", seconds, stage=self.name)
+        for collector in _JOB_COLLECTORS.get():
+            collector.observe(self.name, seconds)
+
+
+def stage(name: str):
+    """
+    Context manager timing the stage called name, a shared no-op one while metrics are off
+    """
+    return _Stage(name) if ENABLED else _NULL
+
+
+def count_frames(amount: int = 1):
+    """
+    Adds amount to the number of colorized frames
+    """
+    if ENABLED:
+        REGISTRY.inc("colorize_frames_total", amount)
+        for collector in _JOB_COLLECTORS.get():
+            collector.count_frames(amount)
+
+
+def queue_depth(name: str, depth: int):
+    """
+    Records the number of items waiting in the pipeline queue called name
+    """
+    if ENABLED:
+        REGISTRY.set("colorize_queue_depth", depth, queue=name)
+
+
+def bind(fn):
+    """
+    fn wrapped to run in a copy of the current context, so that the stages it records in another thread count
+    towards the jobs of the thread that bound it. fn itself while metrics are off.
+    """
+    if not ENABLED:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class _Collector:
+    """
+    Stage times and frames of one job
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.frames = 0
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            count, total = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (count + 1, total + seconds)
+
+    def count_frames(self, amount: int):
+        with self._lock:
+            self.frames += amount
+
+
+class Job:
+    """
+    Per-job summary: frames, seconds, frames per second, time per stage and peak RSS. Use as a context manager
+    around the job; the stages and frames recorded in its context, and in the threads it hands work to through
+    bind(), are collected for it alone, so concurrent jobs do not count each other's work. When it ends, the job's
+    frames per second and the peak RSS are exported as gauges and $COLORIZE_METRICS_FILE is rewritten.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.start = None
+        self.end = None
+        self._collector = None
+        self._token = None
+
+    def __enter__(self):
+        if ENABLED:
+            self._collector = _Collector()
+            self._token = _JOB_COLLECTORS.set(_JOB_COLLECTORS.get() + (self._collector,))
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._collector is None:
+            return
+        self.end = time.perf_counter()
+        _JOB_COLLECTORS.reset(self._token)
+        summary = self.summary()
+        if exc_info[0] is None:
+            status = "done"
+        elif issubclass(exc_info[0], (GeneratorExit, KeyboardInterrupt)):
+            # a cancelled background job is closed at a yield, an interrupted command line run is stopped
+            status = "cancelled"
+        else:
+            status = "failed"
+        REGISTRY.inc("colorize_jobs_total", kind=self.kind, status=status)
+        REGISTRY.set("colorize_job_frames_per_second", summary["frames_per_second"], kind=self.kind)
+        REGISTRY.set("colorize_peak_rss_bytes", peak_rss_bytes())
+        if METRICS_FILE:
+            REGISTRY.write(METRICS_FILE)
+
+    def summary(self) -> dict:
+        """
+        What the job did and where its time went, empty while metrics are off
+        """
+        if self._collector is None:
+            return {}
+        seconds = (self.end or time.perf_counter()) - self.start
+        with self._collector._lock:  # pylint: disable=protected-access
+            frames = self._collector.frames
+            stages = {
+                name: {"calls": count, "seconds": round(total, 4), "mean_ms": round(total / count * 1000, 3)}
+                for name, (count, total) in self._collector.stages.items()
+            }
+        return {
+            "kind": self.kind,
+            "frames": frames,
+            "seconds": round(seconds, 3),
+            "frames_per_second": round(frames / seconds, 3) if seconds > 0 else 0.0,
+            "stages": stages,
+            # the process has no per-job memory accounting, this is the peak of the process so far
+            "peak_rss_mib": round(peak_rss_bytes() / 2**20, 1),
+        }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves REGISTRY on /metrics
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+_server = None
+
+
+def serve(port: int, host: str = METRICS_HOST):
+    """
+    Serves the metrics on http://host:port/metrics from a daemon thread, once per process
+    """
+    global _server  # pylint: disable=global-statement
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def enable(metrics_file: str = None, port: int = None):
+    """
+    Turns the metrics on, optionally writing them to metrics_file after every job and serving them on port
+    """
+    global ENABLED, METRICS_FILE  # pylint: disable=global-statement
+    ENABLED = True
+    METRICS_FILE = metrics_file or METRICS_FILE
+    if port is not None:
+        serve(port)
+
+
+if ENABLED and METRICS_PORT:
+    serve(int(METRICS_PORT))
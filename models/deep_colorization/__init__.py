@@ -1,2 +1,19 @@
 # inside models/deep_colorization/__init__.py
-from .colorizers import eccv16, siggraph17, load_img, preprocess_img, postprocess_tens
+from .colorizers import (
+    eccv16,
+    siggraph17,
+    load_img,
+    preprocess_img,
+    postprocess_tens,
+    preprocess_batch,
+    postprocess_batch,
+    InferenceSession,
+    autograd_bytes_per_frame,
+    MODELS,
+    ModelPool,
+    PRECISIONS,
+    prepare_model,
+    build,
+    fold_batchnorm,
+    colorize_tiled,
+)
@@ -1,4 +1,11 @@
 from .base_color import BaseColor
 from .eccv16 import ECCVGenerator, eccv16
 from .siggraph17 import SIGGRAPHGenerator, siggraph17
-from .util import load_img, resize_img, preprocess_img, postprocess_tens
+from .fold import ChannelShift, fold_batchnorm
+from .inference import InferenceSession, autograd_bytes_per_frame, freeze
+from .precision import PRECISIONS, prepare_model, quantize_int8
+from .export import compiled_path, load_compiled, trace
+from .pool import MODELS, ModelPool, build, generator, model_bytes
+from .tiling import colorize_tiled, tiled_ab
+from .util import load_img, resize_img, preprocess_img, postprocess_tens, preprocess_batch, postprocess_batch
+from .weights import WEIGHTS, WeightsHashError, WeightsNotFoundError, load_state_dict, register_weights
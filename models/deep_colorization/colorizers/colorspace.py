@@ -0,0 +1,86 @@
+import numpy as np
+
+# float32 sRGB <-> CIE Lab conversions following skimage.color (sRGB primaries, D65 white point, 2 degree observer).
+# Arrays are channels last and may have any number of leading dimensions, so N x H x W x 3 batches work as is.
+# Compared with skimage.color.rgb2lab / lab2rgb the results differ by at most 1e-3 in L, a and b and by at most
+# 5e-4 in RGB (an eighth of a uint8 step), see benchmarks/colorspace.py.
+
+XYZ_FROM_RGB = np.array(
+    [
+        [0.412453, 0.357580, 0.180423],
+        [0.212671, 0.715160, 0.072169],
+        [0.019334, 0.119193, 0.950227],
+    ]
+)
+RGB_FROM_XYZ = np.linalg.inv(XYZ_FROM_RGB)
+WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+# white point normalization folded into the colour matrices
+_XYZN_FROM_RGB = (XYZ_FROM_RGB / WHITE_D65[:, None]).T.astype(np.float32)
+_RGB_FROM_XYZN = (RGB_FROM_XYZ * WHITE_D65[None, :]).T.astype(np.float32)
+
+_EPSILON = 0.008856
+_KAPPA = 7.787
+_F_EPSILON = 0.2068966
+_F_OFFSET = 16.0 / 116.0
+
+
+def _srgb_to_linear_exact(rgb):
+    return np.where(rgb > 0.04045, np.power((rgb + 0.055) / 1.055, 2.4), rgb / 12.92)
+
+
+def _linear_to_srgb_exact(lin):
+    return np.where(lin > 0.0031308, 1.055 * np.power(lin, 1 / 2.4) - 0.055, lin * 12.92)
+
+
+# gamma look-up tables: exact for uint8 input, 16384 steps over [0, 1] for the inverse
+LINEAR_LUT_SIZE = 1 << 14
+_LINEAR_FROM_SRGB_U8 = _srgb_to_linear_exact(np.arange(256) / 255.0).astype(np.float32)
+_SRGB_FROM_LINEAR = _linear_to_srgb_exact(np.linspace(0.0, 1.0, LINEAR_LUT_SIZE)).astype(np.float32)
+
+
+def srgb_to_linear(rgb):
+    # uint8 images go through the look-up table, floats are expected in [0, 1]
+    if rgb.dtype == np.uint8:
+        return _LINEAR_FROM_SRGB_U8[rgb]
+    return _srgb_to_linear_exact(np.asarray(rgb, dtype=np.float32)).astype(np.float32, copy=False)
+
+
+def linear_to_srgb(lin):
+    # clips to [0, 1] like skimage.color.xyz2rgb
+    idx = np.clip(lin, 0.0, 1.0, out=np.empty_like(lin, dtype=np.float32))
+    idx *= LINEAR_LUT_SIZE - 1
+    idx += 0.5
+    return _SRGB_FROM_LINEAR[idx.astype(np.int32)]
+
+
+def _f(t):
+    return np.where(t > _EPSILON, np.cbrt(t), _KAPPA * t + _F_OFFSET)
+
+
+def _f_inv(t):
+    return np.where(t > _F_EPSILON, t * t * t, (t - _F_OFFSET) / _KAPPA)
+
+
+def rgb2lab(rgb):
+    lin = srgb_to_linear(rgb)
+    xyz = (lin.reshape(-1, 3) @ _XYZN_FROM_RGB).reshape(lin.shape)
+    fx, fy, fz = _f(xyz[..., 0]), _f(xyz[..., 1]), _f(xyz[..., 2])
+    return np.stack((116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)), axis=-1).astype(np.float32, copy=False)
+
+
+def rgb2l(rgb):
+    # L only depends on the luminance Y, skips the a and b channels entirely
+    lin = srgb_to_linear(rgb)
+    y = lin @ _XYZN_FROM_RGB[:, 1]
+    return (116.0 * _f(y) - 16.0).astype(np.float32, copy=False)
+
+
+def lab2rgb(lab):
+    lab = np.asarray(lab, dtype=np.float32)
+    fy = (lab[..., 0] + 16.0) / 116.0
+    fx = fy + lab[..., 1] / 500.0
+    fz = np.maximum(fy - lab[..., 2] / 200.0, 0.0)
+    xyz = np.stack((_f_inv(fx), _f_inv(fy), _f_inv(fz)), axis=-1)
+    lin = (xyz.reshape(-1, 3) @ _RGB_FROM_XYZN).reshape(xyz.shape)
+    return linear_to_srgb(lin)
@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+import torch
+
+from .inference import freeze
+from .tiling import TILE
+
+# directory of the compiled models, torch's hub directory by default
+EXPORT_DIR_ENV = "COLORIZERS_EXPORT_DIR"
+
+# (batch, height, width) the traced models are checked at: the batches of 8 frames at 256x256 of the pipelines, and
+# the tile size of tiled_ab, whose batches of 4 tiles are not needed to check the batch dimension a second time
+CHECK_SHAPES = ((8, 256, 256), (1, TILE, TILE))
+
+
+def export_dir(cache_dir=None):
+    return Path(cache_dir or os.environ.get(EXPORT_DIR_ENV) or Path(torch.hub.get_dir()) / "colorizers")
+
+
+def compiled_path(name, batch_size=1, HW=(256, 256), cache_dir=None):
+    # the torch version is part of the key, serialized graphs are not portable across versions
+    filename = f"{name}-{batch_size}x1x{HW[0]}x{HW[1]}-torch{torch.__version__}.pt"
+    return export_dir(cache_dir) / filename.replace("+", "_")
+
+
+def trace(model, batch_size=1, HW=(256, 256), check_shapes=CHECK_SHAPES):
+    # trace at a fixed input shape and freeze, parameters become constants and conv+bn pairs are folded
+    model = freeze(model)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, torch.rand(batch_size, 1, *HW) * 100))
+        # the graph is recorded at one shape but run at others, it must still match the eager model there
+        for n, h, w in check_shapes:
+            tens_l = torch.rand(n, 1, h, w) * 100
+            torch.testing.assert_close(
+                traced(tens_l),
+                model(tens_l),
+                rtol=1e-4,
+                atol=1e-3,
+                msg=lambda m: f"traced model differs from the eager one at {n}x1x{h}x{w}: {m}",
+            )
+    return traced
+
+
+def optimize(traced, fuse=True):
+    # conv+bn+relu fusion and MKL-DNN layouts, not serializable so applied after loading
+    return torch.jit.optimize_for_inference(traced) if fuse else traced
+
+
+def load_compiled(name, build, batch_size=1, HW=(256, 256), cache_dir=None, fuse=True):
+    # compiled model called name from the cache, traced from build() and cached on the first call
+    path = compiled_path(name, batch_size=batch_size, HW=HW, cache_dir=cache_dir)
+    if path.is_file():
+        return optimize(torch.jit.load(str(path), map_location="cpu"), fuse=fuse)
+
+    traced = trace(build(), batch_size=batch_size, HW=HW)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write then rename, so that concurrent processes never load a partial file
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    torch.jit.save(traced, str(tmp_path))
+    os.replace(tmp_path, path)
+    return optimize(traced, fuse=fuse)
@@ -0,0 +1,98 @@
+import copy
+
+import torch
+from torch import nn
+
+# Folds frozen batch-norm layers into neighbouring convolutions of the same nn.Sequential:
+#   conv -> bn          the whole affine map goes into the convolution
+#   conv -> relu -> bn  relu(z) * s == relu(z * s) for s > 0, so a strictly positive scale goes into the convolution
+#                       and only the per-channel shift is left, as a ChannelShift
+#   shift -> conv       a leftover shift goes into the bias of a following unpadded convolution; with zero padding
+#                       the borders would see the shift where the original saw zeros, so padded ones keep it
+# Both generators put their batch-norms after a relu and before a padded convolution, so in practice every
+# batch-norm with positive scales becomes a ChannelShift, one addition instead of batch-norm's scale and shift.
+
+CONVS = (nn.Conv2d, nn.ConvTranspose2d)
+
+
+class ChannelShift(nn.Module):
+    def __init__(self, shift):
+        super(ChannelShift, self).__init__()
+        self.register_buffer("shift", shift.detach().clone()[None, :, None, None])
+
+    def forward(self, x):
+        return x + self.shift
+
+
+def bn_affine(bn):
+    # batch-norm in eval mode is y = x * scale + shift
+    scale = 1.0 / torch.sqrt(bn.running_var + bn.eps)
+    if bn.affine:
+        scale = bn.weight * scale
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        shift = shift + bn.bias
+    return scale.detach(), shift.detach()
+
+
+def _scale_conv(conv, scale, shift=None):
+    # out channels of conv become out * scale + shift
+    with torch.no_grad():
+        if isinstance(conv, nn.ConvTranspose2d):
+            # weight is in x out x kh x kw
+            conv.weight.mul_(scale[None, :, None, None])
+        else:
+            conv.weight.mul_(scale[:, None, None, None])
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(scale)
+        bias = bias * scale + (shift if shift is not None else 0)
+        conv.bias = nn.Parameter(bias, requires_grad=False)
+
+
+def _absorb_shift(conv, shift):
+    # conv(x + shift) for an unpadded convolution, i.e. bias += sum over in channels and kernel of weight * shift
+    with torch.no_grad():
+        extra = (conv.weight * shift[None, :, None, None]).sum(dim=(1, 2, 3))
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(extra)
+        conv.bias = nn.Parameter(bias + extra, requires_grad=False)
+
+
+def _foldable_into(conv):
+    return isinstance(conv, CONVS) and conv.groups == 1
+
+
+def _fold_sequential(seq):
+    names = list(seq._modules)
+    folded = 0
+    for i, name in enumerate(names):
+        bn = seq._modules[name]
+        if not isinstance(bn, nn.BatchNorm2d):
+            continue
+        scale, shift = bn_affine(bn)
+        prev1 = seq._modules[names[i - 1]] if i >= 1 else None
+        prev2 = seq._modules[names[i - 2]] if i >= 2 else None
+
+        if _foldable_into(prev1):
+            _scale_conv(prev1, scale, shift)
+            seq._modules[name] = nn.Identity()
+        elif type(prev1) is nn.ReLU and _foldable_into(prev2) and bool((scale > 0).all()):
+            _scale_conv(prev2, scale)
+            following = seq._modules[names[i + 1]] if i + 1 < len(names) else None
+            if isinstance(following, nn.Conv2d) and following.groups == 1 and following.padding in ((0, 0), 0):
+                _absorb_shift(following, shift)
+                seq._modules[name] = nn.Identity()
+            else:
+                seq._modules[name] = ChannelShift(shift)
+        else:
+            continue
+        folded += 1
+    return folded
+
+
+def fold_batchnorm(model):
+    # frozen copy of model with every foldable batch-norm folded, returns (model, number of folded batch-norms)
+    model = copy.deepcopy(model).eval()
+    folded = 0
+    for module in list(model.modules()):
+        if isinstance(module, nn.Sequential):
+            folded += _fold_sequential(module)
+    return model, folded
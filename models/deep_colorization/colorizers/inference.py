@@ -0,0 +1,60 @@
+import threading
+
+import torch
+
+
+def freeze(model):
+    # eval() fixes batch-norm to its running statistics, parameters no longer need gradients
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return model
+
+
+class InferenceSession:
+    """Runs a colorizer with gradients disabled, batch-norm frozen and the input buffer reused between calls."""
+
+    def __init__(self, model, autocast_dtype=None):
+        self.model = freeze(model)
+        # quantized models keep their weights packed and expose no parameters, they run on the CPU in float32
+        param = next(self.model.parameters(), None)
+        self.dtype = param.dtype if param is not None else torch.float32
+        self.device = param.device if param is not None else torch.device("cpu")
+        # reduced precision compute (e.g. torch.bfloat16) with float32 weights
+        self.autocast_dtype = autocast_dtype
+        # one input buffer per thread, a session is shared between Streamlit sessions
+        self._local = threading.local()
+
+    def _input(self, tens_l_rs):
+        # the buffer has the dtype and device of the model, copy_ converts the input
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape != tens_l_rs.shape:
+            buffer = torch.empty(tens_l_rs.shape, dtype=self.dtype, device=self.device)
+            self._local.buffer = buffer
+        return buffer.copy_(tens_l_rs)
+
+    def __call__(self, tens_l_rs):
+        autocast = torch.autocast(
+            self.device.type, dtype=self.autocast_dtype, enabled=self.autocast_dtype is not None
+        )
+        with torch.inference_mode(), autocast:
+            return self.model(self._input(tens_l_rs)).float()
+
+
+def autograd_bytes_per_frame(model, batch_size=1, HW=(256, 256)):
+    # bytes of activations autograd keeps alive per frame when a trainable model is called without no_grad,
+    # which is what InferenceSession saves at peak
+    params = {param.data_ptr() for param in model.parameters()}
+    saved = {}
+
+    def pack(tens):
+        if tens.data_ptr() not in params:
+            saved[tens.data_ptr()] = max(saved.get(tens.data_ptr(), 0), tens.numel() * tens.element_size())
+        return tens
+
+    was_training = model.training
+    model.eval()
+    with torch.enable_grad(), torch.autograd.graph.saved_tensors_hooks(pack, lambda tens: tens):
+        model(torch.rand(batch_size, 1, *HW) * 100)
+    model.train(was_training)
+    return sum(saved.values()) / batch_size
@@ -0,0 +1,144 @@
+import collections
+import threading
+import time
+from pathlib import Path
+
+import torch
+
+from .eccv16 import eccv16
+from .export import load_compiled, trace
+from .fold import fold_batchnorm
+from .inference import InferenceSession
+from .precision import prepare_model
+from .siggraph17 import siggraph17
+from .weights import WEIGHTS
+
+MODELS = {"ECCV16": eccv16, "SIGGRAPH17": siggraph17}
+
+
+def model_bytes(model):
+    # from the state dict, quantized modules keep their packed weights out of parameters()
+    # frozen TorchScript modules have an empty state dict, their weights are constants of the graph
+    tensors = list(model.state_dict().values())
+    if not tensors and isinstance(model, torch.jit.ScriptModule):
+        tensors = [node.output().toIValue() for node in model.graph.findAllNodes("prim::Constant")]
+    tensors = [tens for tens in tensors if isinstance(tens, torch.Tensor)]
+    return sum(tens.numel() * tens.element_size() for tens in tensors)
+
+
+def generator(model, pretrained=True, fold=True):
+    # the model called model in eval mode, with its batch-norms folded into the convolutions
+    net = MODELS[model](pretrained=pretrained)
+    return fold_batchnorm(net)[0] if fold else net.eval()
+
+
+def build(model, precision="fp32", device="cpu", pretrained=True, compiled=False, calibration=None):
+    # InferenceSession for the model called model, compiled models are traced once and then loaded from disk
+    if not compiled:
+        # int8 keeps the batch-norms, quantization fuses what it can itself
+        folded = generator(model, pretrained, fold=precision != "int8")
+        return prepare_model(folded.to(device=device), precision, calibration)
+    if precision != "fp32" or torch.device(device).type != "cpu":
+        raise ValueError("compiled models run in fp32 on the CPU")
+    # not fused: MKL-DNN prepacked weights are opaque to model_bytes and the pool could not budget them
+    if not pretrained:
+        # random weights are never cached
+        return InferenceSession(trace(generator(model, pretrained=False)))
+    # the weights filename carries their hash, new weights get a new compiled model
+    name = Path(WEIGHTS[model.lower()]).stem + "-folded"
+    return InferenceSession(load_compiled(name, lambda: generator(model), fuse=False))
+
+
+class _Entry:
+    def __init__(self, session, nbytes):
+        self.session = session
+        self.nbytes = nbytes
+        self.last_used = time.monotonic()
+
+
+class ModelPool:
+    """
+    Builds each colorizer on first use and shares a single InferenceSession per (model, precision, device, compiled).
+    When the pooled models take more than budget_bytes, the least recently used ones are evicted, and with
+    max_idle_seconds, every get() also evicts the models not used for that long.
+    int8 models are calibrated on calibration, a list of N x 1 x H x W L batches, or on calibration_batches().
+    """
+
+    def __init__(self, budget_bytes=None, pretrained=True, calibration=None, max_idle_seconds=None):
+        self.budget_bytes = budget_bytes
+        self.max_idle_seconds = max_idle_seconds
+        self.pretrained = pretrained
+        self.calibration = calibration
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        # one lock per model being built, so that concurrent callers wait for it instead of building it twice
+        self._building = {}
+
+    def get(self, model, precision="fp32", device="cpu", compiled=False):
+        key = (model, precision, torch.device(device), compiled)
+        session = self._lookup(key)
+        if session is None:
+            session = self._build(key)
+        # after the lookup, which marks the requested model as used
+        if self.max_idle_seconds is not None:
+            self.evict_idle(self.max_idle_seconds)
+        return session
+
+    def _build(self, key):
+        # builds the model of key once, concurrent callers of the same key wait for it
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            session = self._lookup(key)
+            if session is not None:
+                return session
+            model, precision, device, compiled = key
+            try:
+                session = build(model, precision, device, self.pretrained, compiled, self.calibration)
+            except BaseException:
+                # forget the lock of a failed build, such as missing weights offline, so that it can be retried
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            with self._lock:
+                self._entries[key] = _Entry(session, model_bytes(session.model))
+                self._building.pop(key, None)
+                self._evict(keep=key)
+        return session
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            return entry.session
+
+    def _evict(self, keep):
+        # least recently used first, the model just built is always kept
+        while self.budget_bytes is not None and self.nbytes > self.budget_bytes:
+            key = next((key for key in self._entries if key != keep), None)
+            if key is None:
+                return
+            del self._entries[key]
+
+    def evict_idle(self, max_idle_seconds):
+        # drop models not used for max_idle_seconds, returns their keys
+        deadline = time.monotonic() - max_idle_seconds
+        with self._lock:
+            idle = [key for key, entry in self._entries.items() if entry.last_used < deadline]
+            for key in idle:
+                del self._entries[key]
+        return idle
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,72 @@
+import copy
+import os
+from pathlib import Path
+
+import torch
+from torch import nn
+
+from .inference import InferenceSession, freeze
+from .util import load_img, preprocess_img
+
+# fp32: reference, bf16: bfloat16 autocast, int8: post-training static quantization of the conv stacks
+PRECISIONS = ("fp32", "bf16", "int8")
+
+# directory of images used to calibrate int8 activations
+CALIBRATION_DIR_ENV = "COLORIZERS_CALIBRATION_DIR"
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+# modules kept in float: quantizing the softmax over the 313 color bins and the ab head costs most of the accuracy
+FLOAT_MODULES = ("softmax", "model_out")
+
+
+def calibration_batches(directory=None, batch_size=8, HW=(256, 256)):
+    # N x 1 x H x W L batches of the images in directory (default: $COLORIZERS_CALIBRATION_DIR)
+    directory = directory or os.environ.get(CALIBRATION_DIR_ENV)
+    if not directory:
+        raise ValueError(f"int8 quantization needs calibration images, set {CALIBRATION_DIR_ENV}")
+
+    paths = sorted(path for path in Path(directory).iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise ValueError(f"no calibration images in {directory}")
+
+    tens_l_rs = [preprocess_img(load_img(path)[:, :, :3], HW=HW)[1] for path in paths]
+    return [torch.cat(tens_l_rs[i : i + batch_size]) for i in range(0, len(tens_l_rs), batch_size)]
+
+
+class _LOnly(nn.Module):
+    # fixes the optional hint inputs of SIGGRAPHGenerator to None so that FX traces the L-only graph
+    def __init__(self, model):
+        super(_LOnly, self).__init__()
+        self.model = model
+
+    def forward(self, input_l):
+        return self.model(input_l)
+
+
+def quantize_int8(model, calibration, backend="fbgemm"):
+    # post-training static quantization with FX graph mode, conv + relu pairs are fused on the way
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    model = _LOnly(freeze(copy.deepcopy(model)))
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for name in FLOAT_MODULES:
+        qconfig_mapping.set_module_name(f"model.{name}", None)
+
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs=(calibration[0],))
+    with torch.no_grad():
+        for tens_l_rs in calibration:
+            prepared(tens_l_rs)
+    return convert_fx(prepared)
+
+
+def prepare_model(model, precision="fp32", calibration=None):
+    # InferenceSession running model at precision, int8 calibrates on calibration or on calibration_batches()
+    if precision == "fp32":
+        return InferenceSession(model)
+    if precision == "bf16":
+        return InferenceSession(model, autocast_dtype=torch.bfloat16)
+    if precision == "int8":
+        return InferenceSession(quantize_int8(model, calibration if calibration is not None else calibration_batches()))
+    raise ValueError(f"unknown precision {precision!r}, expected one of {PRECISIONS}")
@@ -268,7 +268,7 @@ class SIGGRAPHGenerator(BaseColor):
             ]
         )
 
-    def forward(self, input_a, input_b=None, mask_b=None):
+    def forward(self, input_a, input_b=None, mask_b=None, return_class=False):
         if input_b is None:
             input_b = torch.cat((input_a * 0, input_a * 0), dim=1)
         if mask_b is None:
@@ -290,11 +290,10 @@ class SIGGRAPHGenerator(BaseColor):
         conv10_2 = self.model10(conv10_up)
         out_reg = self.model_out(conv10_2)
 
-        conv9_up = self.model9up(conv8_3) + self.model2short9(conv2_2)
-        conv9_3 = self.model9(conv9_up)
-        conv10_up = self.model10up(conv9_3) + self.model1short10(conv1_2)
-        conv10_2 = self.model10(conv10_up)
-        out_reg = self.model_out(conv10_2)
+        if return_class:
+            # classification head is only evaluated on request, inference only needs the regression output
+            out_class = self.model_class(conv8_3)
+            return (out_class, self.unnormalize_ab(out_reg))
 
         return self.unnormalize_ab(out_reg)
 
@@ -302,13 +301,7 @@ class SIGGRAPHGenerator(BaseColor):
 def siggraph17(pretrained=True):
     model = SIGGRAPHGenerator()
     if pretrained:
-        import torch.utils.model_zoo as model_zoo
+        from .weights import load_state_dict
 
-        model.load_state_dict(
-            model_zoo.load_url(
-                "https://colorizers.s3.us-east-2.amazonaws.com/siggraph17-df00044c.pth",
-                map_location="cpu",
-                check_hash=True,
-            )
-        )
+        model.load_state_dict(load_state_dict("siggraph17"))
     return model
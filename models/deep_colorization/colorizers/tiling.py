@@ -0,0 +1,98 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from .colorspace import lab2rgb, rgb2l
+
+# Tiled inference for large stills: the image is resized to a working resolution (its long side at most working_size)
+# instead of 256x256, cut into overlapping tile x tile crops that go through the model batch_size at a time, and the
+# ab predictions are blended back with weights that fade out over the overlap. The full resolution image is only ever
+# handled strip_rows rows at a time, so peak memory is the input and output images plus a few tiles.
+
+WORKING_SIZE = 1024
+TILE = 512
+OVERLAP = 64
+STRIP_ROWS = 256
+
+# the generators downsample by 8
+MULTIPLE = 8
+
+
+def tile_starts(length, tile, overlap):
+    # start offsets of tiles covering [0, length), consecutive tiles share at least overlap pixels
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    return starts + [length - tile]
+
+
+def feather(tile, overlap):
+    # 1D blending weights of a tile, ramping up over the overlap on both sides and never zero
+    ramp = torch.arange(1, tile + 1, dtype=torch.float32)
+    return torch.minimum(torch.minimum(ramp, ramp.flip(0)) / (overlap + 1), torch.ones(()))
+
+
+def working_hw(HW_orig, working_size=WORKING_SIZE):
+    # working resolution: the original one scaled down so that its long side fits working_size
+    scale = min(working_size / max(HW_orig), 1.0)
+    return max(round(HW_orig[0] * scale), 1), max(round(HW_orig[1] * scale), 1)
+
+
+def tiled_ab(colorizer, tens_l, tile=TILE, overlap=OVERLAP, batch_size=4):
+    # 1 x 2 x H x W ab prediction for the 1 x 1 x H x W L plane tens_l, blended from overlapping tiles
+    H, W = tens_l.shape[2:]
+    # the tiles must fit in the padded plane and have sides the generators can downsample
+    tile_h = min(tile, -(-H // MULTIPLE) * MULTIPLE)
+    tile_w = min(tile, -(-W // MULTIPLE) * MULTIPLE)
+    padded = F.pad(tens_l, (0, max(tile_w - W, 0), 0, max(tile_h - H, 0)), mode="replicate")
+    Hp, Wp = padded.shape[2:]
+
+    weight = feather(tile_h, overlap)[:, None] * feather(tile_w, overlap)[None, :]
+    ab_sum = torch.zeros(1, 2, Hp, Wp)
+    weight_sum = torch.zeros(1, 1, Hp, Wp)
+    origins = [(y, x) for y in tile_starts(Hp, tile_h, overlap) for x in tile_starts(Wp, tile_w, overlap)]
+    for i in range(0, len(origins), batch_size):
+        batch = origins[i : i + batch_size]
+        tiles = torch.cat([padded[:, :, y : y + tile_h, x : x + tile_w] for y, x in batch])
+        out_ab = colorizer(tiles).cpu()
+        for (y, x), ab in zip(batch, out_ab):
+            ab_sum[0, :, y : y + tile_h, x : x + tile_w] += ab * weight
+            weight_sum[0, 0, y : y + tile_h, x : x + tile_w] += weight
+    return (ab_sum / weight_sum)[:, :, :H, :W]
+
+
+def _upsample_rows(out_ab, HW_orig, row0, row1):
+    # rows row0:row1 of the bilinear (align_corners=False) resize of out_ab to HW_orig, without computing the others
+    H, W = HW_orig
+    ys = (torch.arange(row0, row1, dtype=torch.float32) + 0.5) * 2 / H - 1
+    xs = (torch.arange(W, dtype=torch.float32) + 0.5) * 2 / W - 1
+    grid = torch.stack(torch.meshgrid(xs, ys, indexing="xy"), dim=2)[None]
+    return F.grid_sample(out_ab, grid, mode="bilinear", padding_mode="border", align_corners=False)
+
+
+def colorize_tiled(
+    img_rgb_orig,
+    colorizer,
+    working_size=WORKING_SIZE,
+    tile=TILE,
+    overlap=OVERLAP,
+    batch_size=4,
+    strip_rows=STRIP_ROWS,
+):
+    # H x W x 3 uint8 RGB image colorized with tiled inference, as an H x W x 3 uint8 RGB image
+    HW_orig = img_rgb_orig.shape[:2]
+    HW = working_hw(HW_orig, working_size)
+    img_rgb_rs = np.asarray(Image.fromarray(img_rgb_orig).resize((HW[1], HW[0]), resample=Image.BICUBIC))
+    tens_l_rs = torch.from_numpy(rgb2l(img_rgb_rs))[None, None, :, :]
+    out_ab = tiled_ab(colorizer, tens_l_rs, tile=tile, overlap=overlap, batch_size=batch_size)
+
+    out_img = np.empty(img_rgb_orig.shape, dtype=np.uint8)
+    for row0 in range(0, HW_orig[0], strip_rows):
+        row1 = min(row0 + strip_rows, HW_orig[0])
+        tens_l = torch.from_numpy(rgb2l(img_rgb_orig[row0:row1]))[None, None, :, :]
+        out_lab = torch.cat((tens_l, _upsample_rows(out_ab, HW_orig, row0, row1)), dim=1)
+        out_rgb = lab2rgb(out_lab[0].numpy().transpose((1, 2, 0)))
+        out_img[row0:row1] = np.clip(out_rgb * 255 + 0.5, 0, 255).astype(np.uint8)
+    return out_img
@@ -1,10 +1,11 @@
 from PIL import Image
 import numpy as np
-from skimage import color
 import torch
 import torch.nn.functional as F
 from IPython import embed
 
+from .colorspace import lab2rgb, rgb2l
+
 
 def load_img(img_path):
     out_np = np.asarray(Image.open(img_path))
@@ -17,20 +18,39 @@ def resize_img(img, HW=(256, 256), resample=3):
     return np.asarray(Image.fromarray(img).resize((HW[1], HW[0]), resample=resample))
 
 
-def preprocess_img(img_rgb_orig, HW=(256, 256), resample=3):
+def resize_l(tens_orig_l, HW=(256, 256)):
+    # resize N x 1 x H x W L planes with antialiased bicubic interpolation, the torch counterpart of PIL's BICUBIC
+    tens_rs_l = F.interpolate(tens_orig_l, size=HW, mode="bicubic", align_corners=False, antialias=True)
+    return tens_rs_l.clamp_(0.0, 100.0)
+
+
+def preprocess_img(img_rgb_orig, HW=(256, 256), resample=3, l_only=False):
     # return original size L and resized L as torch Tensors
+    # with l_only, convert once at full resolution and resize the L plane instead of the RGB image
+    img_l_orig = rgb2l(img_rgb_orig)
+    tens_orig_l = torch.from_numpy(img_l_orig)[None, None, :, :]
+
+    if l_only:
+        return tens_orig_l, resize_l(tens_orig_l, HW=HW)
+
     img_rgb_rs = resize_img(img_rgb_orig, HW=HW, resample=resample)
+    img_l_rs = rgb2l(img_rgb_rs)
+    tens_rs_l = torch.from_numpy(img_l_rs)[None, None, :, :]
 
-    img_lab_orig = color.rgb2lab(img_rgb_orig)
-    img_lab_rs = color.rgb2lab(img_rgb_rs)
+    return tens_orig_l, tens_rs_l
 
-    img_l_orig = img_lab_orig[:, :, 0]
-    img_l_rs = img_lab_rs[:, :, 0]
 
-    tens_orig_l = torch.Tensor(img_l_orig)[None, None, :, :]
-    tens_rs_l = torch.Tensor(img_l_rs)[None, None, :, :]
+def preprocess_batch(imgs_rgb_orig, HW=(256, 256), resample=3, l_only=False):
+    # return list of original size L and one N x 1 x H x W batch of resized L
+    if l_only and len({img.shape for img in imgs_rgb_orig}) == 1:
+        # frames of a video share their size, the L planes are resized in a single call
+        tens_orig_l = torch.from_numpy(rgb2l(np.stack(imgs_rgb_orig)))[:, None, :, :]
+        return list(tens_orig_l.split(1)), resize_l(tens_orig_l, HW=HW)
 
-    return tens_orig_l, tens_rs_l
+    tens_orig_l, tens_rs_l = zip(
+        *[preprocess_img(img, HW=HW, resample=resample, l_only=l_only) for img in imgs_rgb_orig]
+    )
+    return list(tens_orig_l), torch.cat(tens_rs_l, dim=0)
 
 
 def postprocess_tens(tens_orig_l, out_ab, mode="bilinear"):
@@ -47,4 +67,10 @@ def postprocess_tens(tens_orig_l, out_ab, mode="bilinear"):
         out_ab_orig = out_ab
 
     out_lab_orig = torch.cat((tens_orig_l, out_ab_orig), dim=1)
-    return color.lab2rgb(out_lab_orig.data.cpu().numpy()[0, ...].transpose((1, 2, 0)))
+    return lab2rgb(out_lab_orig.data.cpu().numpy()[0, ...].transpose((1, 2, 0)))
+
+
+def postprocess_batch(tens_orig_l, out_ab, mode="bilinear"):
+    # tens_orig_l 	list of N tensors 1 x 1 x H_orig x W_orig
+    # out_ab 		N x 2 x H x W
+    return [postprocess_tens(tens_l, out_ab[i : i + 1], mode=mode) for i, tens_l in enumerate(tens_orig_l)]
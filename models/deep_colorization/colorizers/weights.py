@@ -0,0 +1,118 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+from urllib.parse import urlparse
+
+import torch
+
+# released weights, the hex digits at the end of each filename are the start of the file's sha256
+WEIGHTS = {
+    "eccv16": "https://colorizers.s3.us-east-2.amazonaws.com/colorization_release_v2-9b330a0b.pth",
+    "siggraph17": "https://colorizers.s3.us-east-2.amazonaws.com/siggraph17-df00044c.pth",
+}
+
+# directory searched before torch's hub cache, and switch that forbids any download
+WEIGHTS_DIR_ENV = "COLORIZERS_WEIGHTS_DIR"
+OFFLINE_ENV = "COLORIZERS_OFFLINE"
+
+HASH_REGEX = re.compile(r"-([a-f0-9]+)\.")
+
+# sha256 (or its first hex digits) of the registered weights whose filename does not carry it
+SHA256 = {}
+
+# torch.load can memory-map checkpoints since torch 2.1
+TORCH_MMAP = tuple(int(v) for v in re.match(r"(\d+)\.(\d+)", torch.__version__).groups()) >= (2, 1)
+
+# (path, size, mtime) of the files whose hash was already checked by this process
+_verified = set()
+
+
+class WeightsNotFoundError(FileNotFoundError):
+    """Raised when weights are not available locally and downloading is not allowed."""
+
+
+class WeightsHashError(ValueError):
+    """Raised when a weights file does not match its hash, or no hash is known for it."""
+
+
+def register_weights(name, url, sha256=None):
+    # url may also be the bare filename of weights that only exist locally
+    # sha256 is required unless the filename ends with the start of it, like the released weights
+    if sha256 is None and not HASH_REGEX.search(os.path.basename(urlparse(url).path)):
+        raise ValueError(f"{url} carries no hash in its filename, its sha256 must be given")
+    if sha256 is not None and not re.fullmatch(r"[a-f0-9]+", sha256.lower()):
+        raise ValueError(f"{sha256} is not a hex digest")
+    WEIGHTS[name] = url
+    if sha256 is None:
+        SHA256.pop(name, None)
+    else:
+        SHA256[name] = sha256.lower()
+
+
+def expected_hash(name, filename):
+    # the registered sha256 of the weights called name, else the hash in their filename
+    if name in SHA256:
+        return SHA256[name]
+    match = HASH_REGEX.search(filename)
+    if match is None:
+        raise WeightsHashError(f"no sha256 is known for {filename}, register it with register_weights(..., sha256=)")
+    return match.group(1)
+
+
+def is_offline():
+    return os.environ.get(OFFLINE_ENV, "").lower() in ("1", "true", "yes")
+
+
+def weights_dirs(weights_dir=None):
+    # directories searched for weights, in order
+    dirs = [Path(d) for d in (weights_dir, os.environ.get(WEIGHTS_DIR_ENV)) if d]
+    dirs.append(Path(torch.hub.get_dir()) / "checkpoints")
+    return dirs
+
+
+def check_hash(path, digest):
+    # digest is the sha256 of the file or its first hex digits
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime, digest)
+    if key in _verified:
+        return
+
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    if not sha256.hexdigest().startswith(digest):
+        raise WeightsHashError(f"{path} does not match its sha256 ({digest})")
+    _verified.add(key)
+
+
+def resolve_weights(name, weights_dir=None, offline=None):
+    # local weights directories first, then download unless offline
+    url = WEIGHTS[name]
+    filename = os.path.basename(urlparse(url).path)
+    digest = expected_hash(name, filename)
+    dirs = weights_dirs(weights_dir)
+
+    for directory in dirs:
+        path = directory / filename
+        if path.is_file():
+            check_hash(path, digest)
+            return path
+
+    if is_offline() if offline is None else offline:
+        searched = ", ".join(str(d) for d in dirs)
+        raise WeightsNotFoundError(f"{filename} not found in {searched} and downloads are disabled")
+
+    path = dirs[0] / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    torch.hub.download_url_to_file(url, str(path), hash_prefix=digest)
+    return path
+
+
+def load_state_dict(name, weights_dir=None, offline=None):
+    path = resolve_weights(name, weights_dir=weights_dir, offline=offline)
+    if TORCH_MMAP:
+        # memory-map the tensors instead of reading the whole file
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    return torch.load(path, map_location="cpu", weights_only=True)
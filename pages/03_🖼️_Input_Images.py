@@ -1,15 +1,13 @@
 import os
-import zipfile
 
 import streamlit as st
-from PIL import Image
 
-from utils import change_model, load_model, setup_columns, set_page_config, colorize_image
+import metrics
+from utils import ImageArchive, colorize_images, colorize_images_tiled, encode_jpeg, get_model, setup_columns
+from utils import display_metrics, set_page_config
 
 set_page_config()
-loaded_model = load_model()
 col2 = setup_columns()
-current_model = None
 
 with col2:
     st.write(
@@ -33,12 +31,14 @@ def main():
         index=0,
     )
 
-    # Make the user select a model
-    loaded_model = change_model(current_model, model)
     st.write(f"Model is now {model}")
 
     # Ask the user if he wants to see colorization
     display_results = st.checkbox("Display results in real time", value=True)
+    high_resolution = st.checkbox(
+        "High-resolution mode (slower, better colors on large scans: the model runs on overlapping tiles of the "
+        "image instead of a 256x256 version of it)"
+    )
 
     # Input for the user to upload images
     uploaded_file = st.file_uploader(
@@ -47,6 +47,8 @@ def main():
 
     # If the user clicks on the button
     if st.button("Colorize"):
+        # Models are loaded on first use and shared between pages and sessions
+        loaded_model = get_model(model)
         # If the user uploaded images
         if uploaded_file is not None:
             if display_results:
@@ -58,42 +60,47 @@ def main():
             else:
                 col1, col2, _ = st.columns(3)
 
-            for i, file in enumerate(uploaded_file):
-                file_extension = os.path.splitext(file.name)[1].lower()
-                if file_extension in [".jpg", ".png", ".jpeg"]:
-                    image = Image.open(file)
-                    if display_results:
-                        with col1:
-                            st.image(image, use_column_width="always")
-                        with col2:
-                            with st.spinner("Colorizing image..."):
-                                out_img, new_img = colorize_image(file, loaded_model)
-                                new_img.save("IMG_" + str(i + 1) + ".jpg")
+            files = [
+                file for file in uploaded_file if os.path.splitext(file.name)[1].lower() in [".jpg", ".png", ".jpeg"]
+            ]
+            single = None
+            with ImageArchive() as archive:
+                with st.spinner("Colorizing images..."), metrics.Job("images") as run_metrics:
+                    # Images are decoded, colorized in batches and shown as soon as they are ready, and encoded
+                    # straight into the zip
+                    if high_resolution:
+                        colorized = colorize_images_tiled(files, loaded_model)
+                    else:
+                        colorized = colorize_images(files, loaded_model)
+                    for i, image, out_img in colorized:
+                        if isinstance(out_img, Exception):
+                            st.warning(f"{files[i].name} could not be colorized: {out_img}", icon="⚠️")
+                            continue
+                        if len(files) > 1:
+                            archive.add("IMG_" + str(i + 1) + ".jpg", out_img)
+                        else:
+                            single = encode_jpeg(out_img)
+                        if display_results:
+                            with col1:
+                                st.image(image, use_column_width="always")
+                            with col2:
                                 st.image(out_img, use_column_width="always")
 
-                    else:
-                        out_img, new_img = colorize_image(file, loaded_model)
-                        new_img.save("IMG_" + str(i + 1) + ".jpg")
-
-            if len(uploaded_file) > 1:
-                # Create a zip file
-                zip_filename = "colorized_images.zip"
-                with zipfile.ZipFile(zip_filename, "w") as zip_file:
-                    # Add colorized images to the zip file
-                    for i in range(len(uploaded_file)):
-                        zip_file.write("IMG_" + str(i + 1) + ".jpg", "IMG_" + str(i) + ".jpg")
-                with col2:
-                    # Provide the zip file data for download
-                    st.download_button(
-                        label="Download Colorized Images" if len(uploaded_file) > 1 else "Download Colorized Image",
-                        data=open(zip_filename, "rb").read(),
-                        file_name=zip_filename,
-                    )
-            else:
+                display_metrics(run_metrics.summary())
+
+                if len(archive) > 0:
+                    with col2:
+                        # Provide the zip file data for download
+                        st.download_button(
+                            label="Download Colorized Images",
+                            data=archive.file(),
+                            file_name="colorized_images.zip",
+                        )
+            if single is not None:
                 with col2:
                     st.download_button(
                         label="Download Colorized Image",
-                        data=open("IMG_1.jpg", "rb").read(),
+                        data=single,
                         file_name="IMG_1.jpg",
                     )
 
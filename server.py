@@ -0,0 +1,401 @@
+"""
+Local HTTP inference service around the colorizers, for other services to call without the Streamlit app.
+Concurrent requests are micro-batched: their 256x256 L planes are gathered into a single forward pass per model.
+
+    python -m server --port 8000 --models ECCV16 SIGGRAPH17 --batch-window-ms 10 --max-batch 16
+
+    POST /colorize/<model>   an image file (JPEG, PNG, ...), answered with the colorized image as PNG, or JPEG with
+                             ?format=jpg
+    POST /colorize/<model>   with Content-Type application/x-npy, an N x H x W x 3 uint8 RGB array of frames saved
+                             with numpy.save, answered with the colorized frames in the same format
+    GET  /stats              requests, frames, batches and p50/p99 latency, as JSON
+    GET  /metrics            the stage metrics in the Prometheus text format, when metrics are on (see metrics.py)
+
+Decoding, pre- and post-processing run in the request threads, only the forward passes are batched. Requests are
+answered with 503 when more than --max-queued frames are waiting for a forward pass, and with 413 when their body is
+larger than --max-body-mb or they hold more than --max-queued frames; both limits are checked before decoding.
+"""
+
+import argparse
+import collections
+import io
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import torch
+
+import metrics
+from models.deep_colorization import MODELS, PRECISIONS, build, postprocess_batch, preprocess_batch
+from utils import COMPILED, L_ONLY, PRECISION, build_model, decode_image, encode_jpeg, to_pil
+
+# Longest time the first request of a batch waits for others, and most frames per forward pass
+BATCH_WINDOW = 0.01
+MAX_BATCH = 16
+
+# Frames waiting for a forward pass beyond which requests are turned away
+MAX_QUEUED_FRAMES = 256
+
+# Largest request body read, in bytes
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+# Latencies kept for the percentiles of /stats
+LATENCY_WINDOW = 10000
+
+NPY_TYPE = "application/x-npy"
+
+_STOP = object()
+
+
+class Overloaded(RuntimeError):
+    """
+    Raised by MicroBatcher.submit when too many frames are waiting
+    """
+
+
+class PayloadTooLarge(ValueError):
+    """
+    Raised for a request body, or a number of frames, above the limits of the server
+    """
+
+
+class MicroBatcher:
+    """
+    Runs the colorizer on the L planes of concurrent requests in one forward pass. The first waiting request opens a
+    window of window seconds, which closes early once max_batch frames are gathered; requests already waiting when
+    it closes still join the batch up to max_batch frames. A request of more than max_batch frames runs on its own.
+    """
+
+    def __init__(self, colorizer, window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH, max_queued=None):
+        self.colorizer = colorizer
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queued = max_queued or MAX_QUEUED_FRAMES
+        self.batches = 0
+        self.frames = 0
+        self._queue = queue.Queue()
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, tens_l_rs) -> Future:
+        """
+        Queues N x 1 x 256 x 256 L planes, the future resolves to their N x 2 x 256 x 256 ab prediction
+        """
+        if len(tens_l_rs) > self.max_queued:
+            raise PayloadTooLarge(f"at most {self.max_queued} frames per request")
+        with self._lock:
+            if self._queued + len(tens_l_rs) > self.max_queued:
+                raise Overloaded(f"{self._queued} frames are waiting")
+            self._queued += len(tens_l_rs)
+        future = Future()
+        self._queue.put((tens_l_rs, future))
+        return future
+
+    def _loop(self):
+        """
+        Gathers batches and runs them until close()
+        """
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is _STOP:
+                return
+            batch, frames = [first], len(first[0])
+            deadline = time.perf_counter() + self.window
+            while frames < self.max_batch:
+                try:
+                    # a timeout of 0 only takes what is already waiting
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP or frames + len(item[0]) > self.max_batch:
+                    carry = item
+                    break
+                batch.append(item)
+                frames += len(item[0])
+            self._run(batch, frames)
+
+    def _run(self, batch: list, frames: int):
+        """
+        One forward pass over the L planes of batch, whose futures get their share of the prediction
+        """
+        with self._lock:
+            self._queued -= frames
+        try:
+            with metrics.stage("inference"):
+                out_ab = self.colorizer(torch.cat([tens_l_rs for tens_l_rs, _ in batch])).cpu()
+        except Exception as e:  # pylint: disable=broad-except
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.frames += frames
+        for (_, future), ab in zip(batch, out_ab.split([len(tens_l_rs) for tens_l_rs, _ in batch])):
+            future.set_result(ab)
+
+    def close(self):
+        """
+        Stops the batching thread once the queued requests are done
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class LatencyStats:
+    """
+    Latencies of the last LATENCY_WINDOW requests, with their percentiles
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, seconds: float, error: bool = False):
+        """
+        Records the latency of one request
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+            self.requests += 1
+            self.errors += error
+
+    def summary(self) -> dict:
+        """
+        Request and error counts with the p50 and p99 latencies, in milliseconds
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+        p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0.0, 0.0)
+        return {"requests": self.requests, "errors": self.errors, "p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+class ColorizeHandler(BaseHTTPRequestHandler):
+    """
+    Request handler, the server carries the batchers of its models in server.batchers and its statistics in
+    server.latency
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        path = urlparse(self.path).path
+        if path == "/stats":
+            stats = self.server.latency.summary()
+            stats["models"] = {
+                name: {
+                    "batches": batcher.batches,
+                    "frames": batcher.frames,
+                    "mean_batch": batcher.frames / batcher.batches if batcher.batches else 0.0,
+                }
+                for name, batcher in self.server.batchers.items()
+            }
+            self._send(200, json.dumps(stats).encode(), "application/json")
+        elif path == "/metrics" and metrics.ENABLED:
+            self._send(200, metrics.REGISTRY.render().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, b"not found\n", "text/plain")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        batcher = self.server.batchers.get(parts[1].upper()) if len(parts) == 2 and parts[0] == "colorize" else None
+        if batcher is None:
+            # the body is left unread, so the connection cannot carry another request
+            self._send(404, f"models: {', '.join(self.server.batchers)}\n".encode(), "text/plain", close=True)
+            return
+        try:
+            body = self._read_body()
+        except PayloadTooLarge as e:
+            self._send(413, f"{e}\n".encode(), "text/plain", close=True)
+            self.server.latency.record(time.perf_counter() - start, error=True)
+            return
+        except ValueError as e:
+            self._send(400, f"{e}\n".encode(), "text/plain", close=True)
+            self.server.latency.record(time.perf_counter() - start, error=True)
+            return
+        try:
+            if self.headers.get("Content-Type", "").split(";")[0] == NPY_TYPE:
+                answer, content_type = self._colorize_frames(batcher, body), NPY_TYPE
+            else:
+                fmt = parse_qs(url.query).get("format", ["png"])[0].lower()
+                answer, content_type = self._colorize_image(batcher, body, fmt)
+            status = 200
+        except Overloaded as e:
+            status, answer, content_type = 503, f"overloaded: {e}\n".encode(), "text/plain"
+        except PayloadTooLarge as e:
+            status, answer, content_type = 413, f"{e}\n".encode(), "text/plain"
+        except Exception as e:  # pylint: disable=broad-except
+            status, answer, content_type = 400, f"{e}\n".encode(), "text/plain"
+        self._send(status, answer, content_type)
+        self.server.latency.record(time.perf_counter() - start, error=status != 200)
+
+    def _read_body(self) -> bytes:
+        """
+        Body of the request, raises PayloadTooLarge above server.max_body bytes and ValueError without a valid
+        Content-Length
+        """
+        length = self.headers.get("Content-Length")
+        if length is None or not length.strip().isdigit():
+            raise ValueError(f"invalid Content-Length: {length}")
+        if int(length) > self.server.max_body:
+            raise PayloadTooLarge(f"bodies are limited to {self.server.max_body} bytes, got {length}")
+        return self.rfile.read(int(length))
+
+    @staticmethod
+    def _colorize_image(batcher: MicroBatcher, body: bytes, fmt: str) -> tuple:
+        """
+        Colorized image file of an image file, and its content type
+        """
+        with metrics.stage("decode"):
+            _, tens_l_orig, tens_l_rs = decode_image(io.BytesIO(body))
+        out_ab = batcher.submit(tens_l_rs).result()
+        with metrics.stage("postprocess"):
+            out_img = postprocess_batch([tens_l_orig], out_ab)[0]
+        with metrics.stage("encode"):
+            if fmt in ("jpg", "jpeg"):
+                answer, content_type = encode_jpeg(out_img), "image/jpeg"
+            else:
+                buffer = io.BytesIO()
+                to_pil(out_img).save(buffer, format="PNG")
+                answer, content_type = buffer.getvalue(), "image/png"
+        metrics.count_frames()
+        return answer, content_type
+
+    @staticmethod
+    def _colorize_frames(batcher: MicroBatcher, body: bytes) -> bytes:
+        """
+        Colorized frames of an N x H x W x 3 uint8 array, both saved with numpy.save
+        """
+        shape, dtype = npy_header(body)
+        if len(shape) != 4 or shape[3] != 3 or dtype != np.uint8:
+            raise ValueError(f"expected N x H x W x 3 uint8 frames, got {dtype} {shape}")
+        if shape[0] > batcher.max_queued:
+            raise PayloadTooLarge(f"at most {batcher.max_queued} frames per request, got {shape[0]}")
+        frames = np.load(io.BytesIO(body), allow_pickle=False)
+        with metrics.stage("preprocess"):
+            tens_l_orig, tens_l_rs = preprocess_batch(list(frames), HW=(256, 256), l_only=L_ONLY)
+        out_ab = batcher.submit(tens_l_rs).result()
+        with metrics.stage("postprocess"):
+            colorized = np.stack([(frame * 255).astype(np.uint8) for frame in postprocess_batch(tens_l_orig, out_ab)])
+        buffer = io.BytesIO()
+        np.save(buffer, colorized)
+        metrics.count_frames(len(colorized))
+        return buffer.getvalue()
+
+    def _send(self, status: int, body: bytes, content_type: str, close: bool = False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if close:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def npy_header(body: bytes) -> tuple:
+    """
+    Shape and dtype of an array saved with numpy.save, read from its header without loading it
+    """
+    buffer = io.BytesIO(body)
+    version = np.lib.format.read_magic(buffer)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(buffer)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(buffer)
+    return shape, dtype
+
+
+def make_server(
+    batchers: dict, host: str = "127.0.0.1", port: int = 8000, max_body: int = MAX_BODY_BYTES
+) -> ThreadingHTTPServer:
+    """
+    HTTP server answering colorization requests with the MicroBatcher of each model, by model name, and reading
+    request bodies of at most max_body bytes
+    """
+    server = ThreadingHTTPServer((host, port), ColorizeHandler)
+    server.daemon_threads = True
+    server.batchers = batchers
+    server.max_body = max_body
+    server.latency = LatencyStats()
+    return server
+
+
+def parse_args(argv=None):
+    """
+    Command-line arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m server", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+    parser.add_argument("--compiled", action="store_true", default=COMPILED, help="run fp32 models with TorchScript")
+    parser.add_argument(
+        "--batch-window-ms",
+        type=float,
+        default=BATCH_WINDOW * 1000,
+        help="longest time a request waits for others to share its forward pass, 0 only batches waiting requests",
+    )
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="most frames per forward pass")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_FRAMES, help="frames waiting before 503s")
+    parser.add_argument(
+        "--max-body-mb", type=float, default=MAX_BODY_BYTES / 2**20, help="largest request body, larger ones get 413"
+    )
+    parser.add_argument("--random-weights", action="store_true", help="skip the released weights, for load tests")
+    parser.add_argument("--metrics", action="store_true", help="record stage timings, served on /metrics")
+    args = parser.parse_args(argv)
+    if args.max_batch < 1 or args.batch_window_ms < 0:
+        parser.error("--max-batch must be positive and --batch-window-ms not negative")
+    if args.compiled and args.precision != "fp32":
+        parser.error("--compiled runs fp32 models only")
+    return args
+
+
+def main(argv=None):
+    """
+    Serves the colorizers until interrupted, then prints the request statistics
+    """
+    args = parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    batchers = {}
+    for model in args.models:
+        if args.random_weights:
+            colorizer = build(model, args.precision, pretrained=False, compiled=args.compiled)
+        else:
+            colorizer = build_model(model, args.precision, compiled=args.compiled)
+        batchers[model] = MicroBatcher(colorizer, args.batch_window_ms / 1000, args.max_batch, args.max_queued)
+
+    server = make_server(batchers, args.host, args.port, int(args.max_body_mb * 2**20))
+    print(f"serving {', '.join(batchers)} on http://{args.host}:{args.port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for batcher in batchers.values():
+            batcher.close()
+    print(json.dumps(server.latency.summary()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Compiled models traced at one shape and run at the shapes of the pipelines
+"""
+
+import pytest
+import torch
+
+from models.deep_colorization.colorizers import generator, model_bytes, trace
+from models.deep_colorization.colorizers.export import CHECK_SHAPES
+
+
+@pytest.fixture(scope="module", params=["ECCV16", "SIGGRAPH17"])
+def model(request):
+    torch.manual_seed(0)
+    return generator(request.param, pretrained=False)
+
+
+@pytest.mark.parametrize("n, h, w", CHECK_SHAPES)
+def test_traced_matches_eager(model, n, h, w):
+    # trace raises when the traced model differs from the eager one at one of check_shapes
+    trace(model, check_shapes=[(n, h, w)])
+
+
+def test_model_bytes_of_compiled_models(model, tmp_path):
+    traced = trace(model, check_shapes=())
+    path = tmp_path / "traced.pt"
+    torch.jit.save(traced, str(path))
+    loaded = torch.jit.load(str(path))
+    # the traced forward leaves out SIGGRAPH17's classification head
+    assert model_bytes(traced) == pytest.approx(model_bytes(model), rel=0.01)
+    assert model_bytes(loaded) == pytest.approx(model_bytes(traced), rel=0.001)
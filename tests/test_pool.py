@@ -0,0 +1,56 @@
+"""
+Sharing, eviction and failed builds of the model pool, with a small stand-in for the colorizers
+"""
+
+import time
+
+import pytest
+import torch
+
+from models.deep_colorization.colorizers import InferenceSession, ModelPool, pool
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """
+    Replaces pool.build with a tiny model, records the models built and fails for the names in builds.failing
+    """
+    built = []
+
+    def build(model, precision, device, pretrained, compiled, calibration):
+        if model in build.failing:
+            raise FileNotFoundError(f"no weights for {model}")
+        built.append(model)
+        return InferenceSession(torch.nn.Conv2d(1, 2, kernel_size=1))
+
+    build.failing = set()
+    build.built = built
+    monkeypatch.setattr(pool, "build", build)
+    return build
+
+
+def test_models_are_shared(builds):
+    models = ModelPool()
+    assert models.get("ECCV16") is models.get("ECCV16")
+    assert builds.built == ["ECCV16"]
+
+
+def test_idle_models_are_evicted(builds):
+    models = ModelPool(max_idle_seconds=0.05)
+    models.get("ECCV16")
+    time.sleep(0.1)
+    models.get("SIGGRAPH17")
+    assert [key[0] for key in models._entries] == ["SIGGRAPH17"]
+    models.get("ECCV16")
+    assert builds.built == ["ECCV16", "SIGGRAPH17", "ECCV16"]
+
+
+def test_failed_build_can_be_retried(builds):
+    models = ModelPool()
+    builds.failing.add("ECCV16")
+    with pytest.raises(FileNotFoundError):
+        models.get("ECCV16")
+    assert not models._building
+    builds.failing.clear()
+    assert models.get("ECCV16") is not None
+    assert builds.built == ["ECCV16"]
@@ -0,0 +1,61 @@
+"""
+The single-pass SIGGRAPH17 forward against the previous one, which ran the decoder twice and kept the second result:
+the outputs must be identical, not only close
+"""
+
+import pytest
+import torch
+
+from models.deep_colorization.colorizers.siggraph17 import siggraph17
+
+
+def two_pass_forward(model, input_a, return_class):
+    """
+    SIGGRAPHGenerator.forward as it was before the decoder was computed once
+    """
+    input_b = torch.cat((input_a * 0, input_a * 0), dim=1)
+    mask_b = input_a * 0
+
+    conv1_2 = model.model1(torch.cat((model.normalize_l(input_a), model.normalize_ab(input_b), mask_b), dim=1))
+    conv2_2 = model.model2(conv1_2[:, :, ::2, ::2])
+    conv3_3 = model.model3(conv2_2[:, :, ::2, ::2])
+    conv4_3 = model.model4(conv3_3[:, :, ::2, ::2])
+    conv5_3 = model.model5(conv4_3)
+    conv6_3 = model.model6(conv5_3)
+    conv7_3 = model.model7(conv6_3)
+
+    conv8_up = model.model8up(conv7_3) + model.model3short8(conv3_3)
+    conv8_3 = model.model8(conv8_up)
+    out_class = model.model_class(conv8_3)
+
+    conv9_up = model.model9up(conv8_3) + model.model2short9(conv2_2)
+    conv9_3 = model.model9(conv9_up)
+    conv10_up = model.model10up(conv9_3) + model.model1short10(conv1_2)
+    conv10_2 = model.model10(conv10_up)
+    out_reg = model.model_out(conv10_2)
+
+    conv9_up = model.model9up(conv8_3) + model.model2short9(conv2_2)
+    conv9_3 = model.model9(conv9_up)
+    conv10_up = model.model10up(conv9_3) + model.model1short10(conv1_2)
+    conv10_2 = model.model10(conv10_up)
+    out_reg = model.model_out(conv10_2)
+
+    if return_class:
+        return out_class, model.unnormalize_ab(out_reg)
+    return model.unnormalize_ab(out_reg)
+
+
+@pytest.mark.parametrize("return_class", [False, True])
+def test_forward_matches_two_pass_decoder(return_class):
+    torch.manual_seed(0)
+    model = siggraph17(pretrained=False).eval()
+    input_a = torch.rand(2, 1, 64, 64) * 100
+
+    with torch.no_grad():
+        expected = two_pass_forward(model, input_a, return_class)
+        actual = model(input_a, return_class=return_class)
+
+    if return_class:
+        assert len(actual) == len(expected) and all(torch.equal(a, e) for a, e in zip(actual, expected))
+    else:
+        assert torch.equal(actual, expected)
@@ -0,0 +1,95 @@
+"""
+Resolving, verifying and loading weights from a local directory, with a small checkpoint named after its sha256
+"""
+
+import hashlib
+
+import pytest
+import torch
+
+from models.deep_colorization.colorizers import weights
+
+
+@pytest.fixture
+def state_dict():
+    torch.manual_seed(0)
+    return torch.nn.Conv2d(1, 2, kernel_size=3).state_dict()
+
+
+def save_checkpoint(state_dict, directory, stem="tiny"):
+    """
+    Saves state_dict in directory under stem-<first 8 hex digits of its sha256>.pth, returns the path
+    """
+    path = directory / f"{stem}.pth"
+    torch.save(state_dict, path)
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    return path.rename(directory / f"{stem}-{digest[:8]}.pth")
+
+
+@pytest.fixture
+def registered(monkeypatch, tmp_path, state_dict):
+    """
+    Registers weights called "tiny" whose file only exists in tmp_path, and forbids downloads
+    """
+    path = save_checkpoint(state_dict, tmp_path)
+    monkeypatch.setitem(weights.WEIGHTS, "tiny", f"https://example.invalid/{path.name}")
+    monkeypatch.delenv(weights.WEIGHTS_DIR_ENV, raising=False)
+    monkeypatch.setenv(weights.OFFLINE_ENV, "1")
+    return path
+
+
+def test_resolve_from_weights_dir(registered, tmp_path):
+    assert weights.resolve_weights("tiny", weights_dir=tmp_path) == registered
+
+
+def test_resolve_from_environment(registered, tmp_path, monkeypatch):
+    monkeypatch.setenv(weights.WEIGHTS_DIR_ENV, str(tmp_path))
+    assert weights.resolve_weights("tiny") == registered
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_load_state_dict(registered, tmp_path, state_dict, monkeypatch, mmap):
+    monkeypatch.setattr(weights, "TORCH_MMAP", weights.TORCH_MMAP and mmap)
+    loaded = weights.load_state_dict("tiny", weights_dir=tmp_path)
+    assert loaded.keys() == state_dict.keys()
+    for key, tensor in state_dict.items():
+        torch.testing.assert_close(loaded[key], tensor)
+
+
+def test_hash_mismatch(registered, tmp_path):
+    registered.write_bytes(registered.read_bytes() + b"\0")
+    with pytest.raises(weights.WeightsHashError):
+        weights.resolve_weights("tiny", weights_dir=tmp_path)
+
+
+def test_offline_without_local_file(registered, tmp_path):
+    registered.unlink()
+    with pytest.raises(weights.WeightsNotFoundError):
+        weights.resolve_weights("tiny", weights_dir=tmp_path)
+    with pytest.raises(weights.WeightsNotFoundError):
+        weights.resolve_weights("tiny", weights_dir=tmp_path, offline=True)
+
+
+def test_empty_hash_is_not_a_hash():
+    assert weights.HASH_REGEX.search("weights-.pth") is None
+    assert weights.HASH_REGEX.search("siggraph17-df00044c.pth").group(1) == "df00044c"
+
+
+def test_no_known_hash_is_refused(registered, tmp_path, monkeypatch):
+    bare = registered.rename(tmp_path / "tiny.pth")
+    monkeypatch.setitem(weights.WEIGHTS, "tiny", bare.name)
+    with pytest.raises(weights.WeightsHashError):
+        weights.resolve_weights("tiny", weights_dir=tmp_path)
+    with pytest.raises(ValueError):
+        weights.register_weights("tiny", bare.name)
+
+
+def test_registered_sha256(registered, tmp_path, monkeypatch):
+    monkeypatch.setattr(weights, "SHA256", {})
+    sha256 = hashlib.sha256(registered.read_bytes()).hexdigest()
+    bare = registered.rename(tmp_path / "tiny.pth")
+    weights.register_weights("tiny", bare.name, sha256=sha256)
+    assert weights.resolve_weights("tiny", weights_dir=tmp_path) == bare
+    weights.register_weights("tiny", bare.name, sha256="0" * 64)
+    with pytest.raises(weights.WeightsHashError):
+        weights.resolve_weights("tiny", weights_dir=tmp_path)
@@ -1,16 +1,56 @@
+import io
+import itertools
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import numpy as np
 import requests
 import streamlit as st
+import torch
 from PIL import Image
 from streamlit_lottie import st_lottie
 
-from models.deep_colorization import eccv16
-from models.deep_colorization import siggraph17
+import metrics
+from jobs import DONE, FAILED, FINISHED, QUEUED, RUNNING, JobManager, JobRejected
+from models.deep_colorization import ModelPool, build, colorize_tiled
 from models.deep_colorization import postprocess_tens, preprocess_img, load_img
+from models.deep_colorization import postprocess_batch, preprocess_batch
+
+# Number of frames stacked into a single forward pass of the colorizer
+BATCH_SIZE = 8
+
+# Threads decoding and post-processing images around the forward passes of colorize_images
+IMAGE_WORKERS = os.cpu_count() or 1
+
+# Long side of the working resolution of high-resolution mode, which colorizes overlapping tiles instead of a 256x256
+# version of the whole image
+TILED_WORKING_SIZE = 1024
+
+# Size up to which ImageArchive keeps its zip in memory, larger archives spill to an anonymous temporary file
+ARCHIVE_SPOOL_BYTES = 32 << 20
+
+# Memory the shared model pool may use before evicting the least recently used models
+MODEL_POOL_BUDGET = 1 << 30
 
+# Seconds after which a model nobody used is unloaded from the shared pool
+MODEL_IDLE_SECONDS = 600
 
-class SameModelException(ValueError):
-    """Exception raised when the same model is attempted to be reloaded."""
+# Precision the models run at: "fp32", "bf16" (bfloat16 autocast) or "int8" (static quantization, calibrated on
+# the images in $COLORIZERS_CALIBRATION_DIR)
+PRECISION = os.environ.get("COLORIZERS_PRECISION", "fp32")
+
+# Seconds between two polls of a background job by the page showing it
+JOB_POLL_SECONDS = 1.0
+
+# Whether the network input is resized from the full-resolution L plane (faster) instead of from the RGB image like
+# the original pipeline. Off until `python -m benchmarks.preprocess_quality` passes with the released weights.
+L_ONLY = os.environ.get("COLORIZERS_L_ONLY", "").lower() in ("1", "true", "yes")
+
+# Whether fp32 models are traced with TorchScript, the traced models are cached on disk for the next processes
+COMPILED = os.environ.get("COLORIZERS_COMPILED", "").lower() in ("1", "true", "yes")
 
 
 def set_page_config():
@@ -20,11 +60,26 @@ def set_page_config():
     st.set_page_config(page_title="Image & Video Colorizer", page_icon="🎨", layout="wide")
 
 
-def load_model():
+def build_model(model: str, precision: str = PRECISION, compiled: bool = COMPILED):
     """
-    Loads the default model.
+    Builds the pretrained model called model ("ECCV16" or "SIGGRAPH17") ready for inference at precision.
     """
-    return eccv16(pretrained=True).eval()
+    return build(model, precision, compiled=compiled)
+
+
+@st.cache_resource()
+def get_model_pool() -> ModelPool:
+    """
+    Process-wide pool of models, shared by every page and session
+    """
+    return ModelPool(budget_bytes=MODEL_POOL_BUDGET, max_idle_seconds=MODEL_IDLE_SECONDS)
+
+
+def get_model(model: str, precision: str = PRECISION, compiled: bool = COMPILED):
+    """
+    Returns the shared model called model at precision, loading it on first use
+    """
+    return get_model_pool().get(model, precision, compiled=compiled)
 
 
 def setup_columns():
@@ -53,23 +108,6 @@ def load_lottieurl(url: str):
         return None
 
 
-@st.cache_resource()
-def change_model(current_model, model):
-    """
-    Change model
-    """
-    loaded_model = "None"
-
-    if current_model != model:
-        if model == "ECCV16":
-            loaded_model = eccv16(pretrained=True).eval()
-        elif model == "SIGGRAPH17":
-            loaded_model = siggraph17(pretrained=True).eval()
-        return loaded_model
-
-    raise SameModelException("Model is the same as the current one.")
-
-
 def format_time(seconds: float) -> str:
     """Formats time in seconds to a human readable format"""
     if seconds < 60:
@@ -91,26 +129,326 @@ def format_time(seconds: float) -> str:
     return f"{days} days, {hours} hours, {minutes} minutes, and {int(seconds)} seconds"
 
 
-# Function to colorize video frames
-def colorize_frame(frame, colorizer) -> np.ndarray:
+@st.cache_resource()
+def get_job_manager() -> JobManager:
+    """
+    Process-wide background job manager, shared by every page and session
+    """
+    return JobManager()
+
+
+def start_job(key: str, work, source, files=()):
+    """
+    Submits work (see jobs.JobManager) as the job of this session stored under key in st.session_state, with the
+    video it colorizes, cancelling the previous job of that key. Warns instead when too many jobs are queued.
+    """
+    manager = get_job_manager()
+    if key in st.session_state:
+        manager.cancel(st.session_state[key][0])
+        del st.session_state[key]
+    try:
+        job = manager.submit(work, kind="video", files=files)
+    except JobRejected as e:
+        for path in files:
+            os.remove(path)
+        st.warning(f"The server is busy: {e}", icon="⚠️")
+        return
+    st.session_state[key] = (job.id, source)
+
+
+def display_video_job(key: str) -> bool:
+    """
+    Shows the job of this session stored under key in st.session_state next to its source video: its place in the
+    queue, its progress and remaining time with a button cancelling it, or the colorized video once it is done.
+    Returns whether the job is still queued or running, the page should then rerun in JOB_POLL_SECONDS to poll it.
+    """
+    if key not in st.session_state:
+        return False
+    job_id, source = st.session_state[key]
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        del st.session_state[key]
+        st.info("The colorized video expired, colorize it again.")
+        return False
+
+    col1, col2 = st.columns([0.5, 0.5])
+    with col1:
+        st.markdown('<p style="text-align: center;">Before</p>', unsafe_allow_html=True)
+        st.video(source)
+    with col2:
+        st.markdown('<p style="text-align: center;">After</p>', unsafe_allow_html=True)
+        if job.status in (QUEUED, RUNNING):
+            if job.cancel_requested.is_set():
+                st.text("Cancelling...")
+            elif job.status == QUEUED:
+                st.text(f"Queued, {manager.position(job)} job(s) ahead in the queue...")
+            else:
+                st.progress(job.progress)
+                remaining = job.seconds_remaining
+                st.text(
+                    f"Time Remaining: {format_time(remaining)}" if remaining is not None else "Colorizing frames..."
+                )
+            if st.button("Cancel", key=f"cancel_{job.id}"):
+                manager.cancel(job.id)
+                st.rerun()
+        elif job.status == DONE:
+            result = job.result
+            # Display the colorized video using st.video()
+            st.video(result["output"])
+            if not st.session_state.get(f"celebrated_{job.id}"):
+                st.session_state[f"celebrated_{job.id}"] = True
+                st.balloons()
+            if result["hit_rate"] is not None:
+                st.caption(f"{result['hit_rate']:.0%} of the frames reused the colors of an earlier frame")
+            display_metrics(result["metrics"])
+
+            # Add a download button for the colorized video
+            with open(result["output"], "rb") as file:
+                st.download_button(label="Download Colorized Video", data=file, file_name="colorized_video.mp4")
+        elif job.status == FAILED:
+            st.error(f"The video could not be colorized: {job.error}")
+        else:
+            st.info("Colorization cancelled.")
+    return job.status not in FINISHED
+
+
+def poll_job():
+    """
+    Reruns the page in JOB_POLL_SECONDS to show the progress of its background job
+    """
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+
+
+def display_metrics(summary: dict):
     """
-    Colorize frame
+    Shows the metrics summary of a job (see metrics.Job) in a collapsed section, when metrics are on
     """
-    tens_l_orig, tens_l_rs = preprocess_img(frame, HW=(256, 256))
-    return postprocess_tens(tens_l_orig, colorizer(tens_l_rs).cpu())
+    if summary:
+        with st.expander("Metrics"):
+            st.json(summary)
 
 
-def colorize_image(file, loaded_model):
+def read_frames(video):
     """
-    Colorize image
+    Yield frames from an opened cv2.VideoCapture until the stream is exhausted
+    """
+    while True:
+        with metrics.stage("decode"):
+            ret, frame = video.read()
+        if not ret:
+            return
+        yield frame
+
+
+def colorize_batch(frames, colorizer, reuse=None) -> list:
+    """
+    Colorize a list of frames with a single forward pass of the colorizer.
+    With reuse (see video.StaticFrameCache), only the frames it cannot predict from earlier ones go through the model.
+    """
+    with metrics.stage("preprocess"):
+        tens_l_orig, tens_l_rs = preprocess_batch(frames, HW=(256, 256), l_only=L_ONLY)
+    if reuse is None:
+        with metrics.stage("inference"):
+            out_ab = colorizer(tens_l_rs).cpu()
+    else:
+        tens_l_rs = list(tens_l_rs.split(1))
+        with metrics.stage("reuse"):
+            infer = [i for i, tens_l in enumerate(tens_l_rs) if reuse.needs_inference(tens_l)]
+        with metrics.stage("inference"):
+            out_ab = colorizer(torch.cat([tens_l_rs[i] for i in infer])).cpu().split(1) if infer else []
+        with metrics.stage("reuse"):
+            out_ab = dict(zip(infer, out_ab))
+            out_ab = torch.cat([reuse.resolve(tens_l, out_ab.get(i)) for i, tens_l in enumerate(tens_l_rs)])
+    with metrics.stage("postprocess"):
+        return postprocess_batch(tens_l_orig, out_ab)
+
+
+def colorize_frames(frames, colorizer, batch_size: int = BATCH_SIZE, reuse=None):
+    """
+    Colorize an iterable of frames, batch_size frames per forward pass.
+    Colorized frames are yielded in input order.
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield from colorize_batch(batch, colorizer, reuse)
+            batch = []
+    if batch:
+        yield from colorize_batch(batch, colorizer, reuse)
+
+
+def decode_image(file) -> tuple:
+    """
+    Decodes an image file, returns the RGB image with its full resolution and 256x256 L channels
     """
     img = load_img(file)
     # If user input a colored image with 4 channels, discard the fourth channel
     if img.shape[2] == 4:
         img = img[:, :, :3]
 
-    tens_l_orig, tens_l_rs = preprocess_img(img, HW=(256, 256))
-    out_img = postprocess_tens(tens_l_orig, loaded_model(tens_l_rs).cpu())
-    new_img = Image.fromarray((out_img * 255).astype(np.uint8))
+    tens_l_orig, tens_l_rs = preprocess_img(img, HW=(256, 256), l_only=L_ONLY)
+    return img, tens_l_orig, tens_l_rs
+
+
+def _timed(stage: str, fn, *args):
+    """
+    fn(*args), timed as stage
+    """
+    with metrics.stage(stage):
+        return fn(*args)
+
+
+def colorize_images(files, colorizer, batch_size: int = BATCH_SIZE, workers: int = IMAGE_WORKERS):
+    """
+    Colorize many image files: a pool of workers threads decodes them, the colorizer runs on batches of batch_size
+    256x256 L channels, and the pool post-processes the results at full resolution while the next batch runs.
+    At most two batches of images are decoded ahead, so memory does not grow with the number of files.
+    Yields (index in files, RGB image, colorized image) as images finish, not in input order; the colorized image is
+    the exception raised instead when the file could not be decoded or colorized.
+    """
+    files = enumerate(files)
+    decoding, postprocessing = {}, {}
+    batch = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for index, file in itertools.islice(files, max(2 * batch_size - len(decoding), 0)):
+                decoding[executor.submit(metrics.bind(_timed), "decode", decode_image, file)] = index
+
+            if len(batch) >= batch_size or (batch and not decoding):
+                batch, rest = batch[:batch_size], batch[batch_size:]
+                try:
+                    with metrics.stage("inference"):
+                        out_ab = colorizer(torch.cat([tens_l_rs for _, _, _, tens_l_rs in batch])).cpu().split(1)
+                except Exception as e:  # pylint: disable=broad-except
+                    for index, img, _, _ in batch:
+                        yield index, img, e
+                else:
+                    for (index, img, tens_l_orig, _), ab in zip(batch, out_ab):
+                        future = executor.submit(metrics.bind(_timed), "postprocess", postprocess_tens, tens_l_orig, ab)
+                        postprocessing[future] = index, img
+                batch = rest
+                continue
+
+            if not decoding and not postprocessing:
+                return
+            done, _ = wait(list(decoding) + list(postprocessing), return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if future in decoding:
+                    index = decoding.pop(future)
+                    if error is None:
+                        batch.append((index, *future.result()))
+                    else:
+                        yield index, None, error
+                else:
+                    index, img = postprocessing.pop(future)
+                    metrics.count_frames()
+                    yield index, img, future.result() if error is None else error
+
+
+def colorize_images_tiled(files, colorizer, working_size: int = TILED_WORKING_SIZE):
+    """
+    High-resolution counterpart of colorize_images: each image runs through the model as overlapping tiles of a
+    version of it whose long side is at most working_size, and its colors are blended back at full resolution a few
+    rows at a time, so memory stays bounded on 4K and 8K images.
+    Yields (index in files, RGB image, colorized uint8 RGB image or the exception raised) in input order.
+    """
+    for index, file in enumerate(files):
+        img = None
+        try:
+            with metrics.stage("decode"):
+                img = load_img(file)[:, :, :3]
+            with metrics.stage("colorize_tiled"):
+                out_img = colorize_tiled(img, colorizer, working_size=working_size)
+            metrics.count_frames()
+        except Exception as e:  # pylint: disable=broad-except
+            out_img = e
+        yield index, img, out_img
+
+
+def to_pil(image: np.ndarray) -> Image.Image:
+    """
+    PIL image of an RGB image, either uint8 or with values in [0, 1]
+    """
+    return Image.fromarray(image if image.dtype == np.uint8 else (image * 255).astype(np.uint8))
+
+
+def encode_jpeg(image: np.ndarray, file=None, quality: int = 75):
+    """
+    Encode an RGB image, uint8 or with values in [0, 1], as JPEG into file, or return the JPEG bytes when file is None
+    """
+    new_img = to_pil(image)
+    if file is not None:
+        new_img.save(file, format="JPEG", quality=quality)
+        return None
+    buffer = io.BytesIO()
+    new_img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class ImageArchive:
+    """
+    Zip archive of JPEG images built as they are added: each image is encoded straight into its zip entry, and the
+    archive lives in memory up to spool_bytes, then in an anonymous temporary file. Nothing is written under a name,
+    so concurrent sessions cannot overwrite each other's images.
+    Hand file() rather than getvalue() to st.download_button: it reads the file into the one copy it serves the
+    download from, where getvalue() makes a copy of its own first.
+    """
+
+    def __init__(self, spool_bytes: int = ARCHIVE_SPOOL_BYTES, quality: int = 75):
+        self.quality = quality
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        # JPEG does not compress any further, entries are stored
+        self._zip = zipfile.ZipFile(self._buffer, "w", compression=zipfile.ZIP_STORED)
+        self._reader = None
+
+    def __len__(self) -> int:
+        return len(self._zip.infolist())
+
+    def add(self, name: str, image: np.ndarray):
+        """
+        Encode an RGB image, uint8 or with values in [0, 1], into the entry called name
+        """
+        with self._zip.open(name, "w") as entry:
+            encode_jpeg(image, entry, self.quality)
+
+    def file(self):
+        """
+        Finish the archive and return its file, on disk and at its start. It stays open until the archive is closed.
+        """
+        self._zip.close()
+        # an archive still in memory goes to disk, the reader of the file makes the only copy in memory
+        self._buffer.rollover()
+        if self._reader is None:
+            # a BufferedReader, the kind of file st.download_button reads, over the file of the archive
+            self._reader = open(self._buffer.fileno(), "rb", closefd=False)  # pylint: disable=consider-using-with
+        self._reader.seek(0)
+        return self._reader
+
+    def getvalue(self) -> bytes:
+        """
+        Finish the archive and return its bytes, the archive's own buffer is released
+        """
+        self._zip.close()
+        self._buffer.seek(0)
+        data = self._buffer.read()
+        self._buffer.close()
+        return data
+
+    def close(self):
+        """
+        Release the archive's memory or temporary file
+        """
+        self._zip.close()
+        if self._reader is not None:
+            self._reader.close()
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
 
-    return out_img, new_img
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,721 @@
+import collections
+import copy
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import cv2
+import imageio_ffmpeg
+import numpy as np
+import torch
+
+import metrics
+from utils import BATCH_SIZE, PRECISION, build_model, colorize_frames, read_frames
+
+# Maximum number of frames buffered between two pipeline stages
+QUEUE_SIZE = 16
+
+# Default number of worker processes and number of frames handed to a worker at a time
+WORKERS = max((os.cpu_count() or 1) // 2, 1)
+CHUNK_FRAMES = 16
+
+# Mean absolute difference of the 256x256 L channel (in L units, 0 to 100) under which a frame counts as static
+STATIC_THRESHOLD = 0.5
+
+# Default number of frames per keyframe, and L1 distance between the L histograms of a frame and its keyframe
+# (from 0 to 2) that marks a new scene
+KEYFRAME_INTERVAL = 5
+SCENE_THRESHOLD = 0.5
+
+# x264 settings of the colorized videos, the defaults of x264
+X264_PRESET = "medium"
+X264_CRF = 23
+
+# Audio codecs that mp4 files take as they are, other audio streams are converted to AAC
+MP4_AUDIO_CODECS = ("aac", "mp3", "alac", "ac3", "eac3", "opus", "flac")
+
+# Frames per segment of a SegmentedVideoJob, about ten seconds of video, and the directory holding the jobs
+SEGMENT_FRAMES = 250
+JOBS_DIR_ENV = "COLORIZE_JOBS_DIR"
+
+# Colorizer of a worker process, loaded once by _init_worker
+_worker_colorizer = None
+
+_DONE = object()
+
+
+class _Raised:
+    """Wraps an exception raised by a producer thread so it can be re-raised by the consumer."""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(buffer, item, stop) -> bool:
+    """
+    Put item in buffer, waiting for room unless the consumer went away
+    """
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(iterable, maxsize: int = QUEUE_SIZE, name: str = "prefetch"):
+    """
+    Iterate over iterable in a background thread, buffering at most maxsize items ahead of the consumer.
+    The number of buffered items is reported to metrics as the depth of the queue called name.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(buffer, item, stop):
+                    return
+        except Exception as exc:  # pylint: disable=broad-except
+            _put(buffer, _Raised(exc), stop)
+            return
+        _put(buffer, _DONE, stop)
+
+    # bound, so that the stages of the producer count towards the jobs of the consumer
+    thread = threading.Thread(target=metrics.bind(produce), daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            metrics.queue_depth(name, buffer.qsize())
+            if item is _DONE:
+                return
+            if isinstance(item, _Raised):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class StaticFrameCache:
+    """
+    Reuses the ab prediction of the last colorized frame while new frames stay within threshold of its L channel,
+    which skips the model on title cards, freeze frames and telecine duplicates. A threshold of 0 only reuses
+    exact duplicates. Pass it as the reuse argument of colorize_video.
+    """
+
+    def __init__(self, threshold: float = STATIC_THRESHOLD):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._reference_l = None
+        self._reference_ab = None
+
+    def needs_inference(self, tens_l_rs) -> bool:
+        """
+        Decides whether a frame must go through the model, frames are seen in order
+        """
+        if self._reference_l is not None:
+            if torch.equal(tens_l_rs, self._reference_l) or (
+                (tens_l_rs - self._reference_l).abs().mean().item() <= self.threshold
+            ):
+                self.hits += 1
+                return False
+        self._reference_l = tens_l_rs
+        self.misses += 1
+        return True
+
+    def resolve(self, tens_l_rs, out_ab):  # pylint: disable=unused-argument
+        """
+        Returns the ab prediction of a frame, out_ab is None for the frames that skipped the model
+        """
+        if out_ab is not None:
+            self._reference_ab = out_ab
+        return self._reference_ab
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Share of the frames that reused an earlier prediction
+        """
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def stats(self) -> dict:
+        """
+        Hit-rate statistics
+        """
+        return {"frames": self.hits + self.misses, "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+
+class KeyframePropagator:
+    """
+    Runs the model on keyframes only, one every interval frames and at every scene change (the L histogram moved by
+    more than scene_threshold), and carries their ab prediction to the frames in between by warping the 256x256 ab
+    map along the optical flow between the frame's L channel and the keyframe's. Pass it as the reuse argument of
+    colorize_video.
+    """
+
+    def __init__(self, interval: int = KEYFRAME_INTERVAL, scene_threshold: float = SCENE_THRESHOLD):
+        self.interval = interval
+        self.scene_threshold = scene_threshold
+        self.hits = 0
+        self.misses = 0
+        self._since_keyframe = 0
+        self._keyframe_histogram = None
+        self._keyframe_gray = None
+        self._keyframe_ab = None
+
+    @classmethod
+    def for_fps(cls, fps: float, inference_fps: float, scene_threshold: float = SCENE_THRESHOLD):
+        """
+        Propagator running the model inference_fps times per second of a video playing at fps
+        """
+        return cls(max(round(fps / inference_fps), 1), scene_threshold)
+
+    def needs_inference(self, tens_l_rs) -> bool:
+        """
+        Decides whether a frame is a keyframe, frames are seen in order
+        """
+        # histograms ignore motion, unlike pixel differences, so pans do not count as scene changes
+        histogram = torch.histc(tens_l_rs, bins=32, min=0, max=100)
+        histogram /= histogram.sum()
+        self._since_keyframe += 1
+        if (
+            self._keyframe_histogram is None
+            or self._since_keyframe >= self.interval
+            or (histogram - self._keyframe_histogram).abs().sum().item() > self.scene_threshold
+        ):
+            self._keyframe_histogram = histogram
+            self._since_keyframe = 0
+            self.misses += 1
+            return True
+        self.hits += 1
+        return False
+
+    def resolve(self, tens_l_rs, out_ab):
+        """
+        Returns the ab prediction of a frame, out_ab is None for the frames in between keyframes
+        """
+        gray = _to_gray(tens_l_rs)
+        if out_ab is not None:
+            self._keyframe_gray = gray
+            self._keyframe_ab = out_ab[0].numpy()
+            return out_ab
+
+        # flow from the frame to the keyframe gives, for every pixel of the frame, where to sample the keyframe
+        flow = cv2.calcOpticalFlowFarneback(gray, self._keyframe_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        height, width = gray.shape
+        grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        map_x, map_y = grid_x + flow[..., 0], grid_y + flow[..., 1]
+        warped = [
+            cv2.remap(ab, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE) for ab in self._keyframe_ab
+        ]
+        return torch.from_numpy(np.stack(warped))[None]
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Share of the frames that were propagated from a keyframe
+        """
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def stats(self) -> dict:
+        """
+        Keyframe statistics
+        """
+        return {"frames": self.hits + self.misses, "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+
+# Frame reuse strategies offered by the video pages
+REUSE_MODES = {
+    "Colorize every frame": None,
+    "Reuse the colors of near-identical frames": StaticFrameCache,
+    "Colorize keyframes only and propagate their colors": KeyframePropagator,
+}
+
+
+def _to_gray(tens_l_rs) -> np.ndarray:
+    """
+    1 x 1 x H x W L channel (0 to 100) to an 8-bit image for optical flow
+    """
+    return (tens_l_rs[0, 0] * 2.55).clamp(0, 255).to(torch.uint8).numpy()
+
+
+def frame_size(video) -> tuple:
+    """
+    Returns the (width, height) of the frames of an opened cv2.VideoCapture
+    """
+    return int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+
+def audio_codec(path) -> str:
+    """
+    Returns the codec name of the first audio stream of the media file at path, None when it has none
+    """
+    probe = subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-i", str(path)],
+        capture_output=True,
+        text=True,
+        errors="replace",
+        check=False,
+    )
+    match = re.search(r"Stream #.*?: Audio: (\w+)", probe.stderr)
+    return match.group(1) if match else None
+
+
+def audio_args(audio_source, filename) -> list:
+    """
+    ffmpeg arguments that add the first audio stream of audio_source as the second input and map it into filename
+    next to the video of the first input, copied as it is when the container of filename takes its codec
+    """
+    codec = audio_codec(audio_source) if audio_source is not None else None
+    if codec is None:
+        return []
+    copy = codec in MP4_AUDIO_CODECS or not str(filename).lower().endswith((".mp4", ".mov"))
+    # no -shortest: audio that ends a few milliseconds before the video would cut its last frame
+    return ["-i", str(audio_source), "-map", "0:v:0", "-map", "1:a:0", "-c:a", "copy" if copy else "aac"]
+
+
+class FFmpegWriter:
+    """
+    Drop-in replacement for cv2.VideoWriter that pipes BGR frames into a single ffmpeg encode to H.264 (yuv420p, which
+    browsers play) and muxes in the first audio stream of audio_source, copied as it is when the container takes its
+    codec. ffmpeg is the one of imageio_ffmpeg, $IMAGEIO_FFMPEG_EXE when set.
+    """
+
+    def __init__(self, filename, fps: float, size: tuple, audio_source=None, preset=X264_PRESET, crf=X264_CRF):
+        width, height = size
+        command = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error"]
+        command += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"]
+        command += audio_args(audio_source, filename)
+        # yuv420p needs even dimensions, faststart lets playback begin before the whole file is downloaded
+        command += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"]
+        command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-movflags", "+faststart", str(filename)]
+        # stderr goes to a file rather than a pipe, which a chatty ffmpeg could fill before release() reads it
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+        self._error = None
+
+    def write(self, frame: np.ndarray):
+        """
+        Encodes an H x W x 3 uint8 BGR frame, raises RuntimeError with ffmpeg's message if ffmpeg exited
+        """
+        if self._process.stdin.closed:
+            raise RuntimeError(self._error or "write to a released FFmpegWriter")
+        try:
+            self._process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except BrokenPipeError:
+            self.release()
+            # ffmpeg exited without an error before reading every frame
+            self._error = f"ffmpeg stopped reading frames: {self._error}"
+            raise RuntimeError(self._error) from None
+
+    def release(self):
+        """
+        Finishes the file, raises RuntimeError with ffmpeg's message if the encode failed
+        """
+        if self._process.stdin.closed:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        self._stderr.seek(0)
+        self._error = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if returncode != 0:
+            self._error = f"ffmpeg failed: {self._error}"
+            raise RuntimeError(self._error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.release()
+            return
+        # the exception that stopped the writing, or the cancel of a job, is the one to report and not the ffmpeg
+        # error it may cause
+        try:
+            self.release()
+        except RuntimeError:
+            pass
+
+
+def colorize_video(video, writer, colorizer, batch_size: int = BATCH_SIZE, queue_size: int = QUEUE_SIZE, reuse=None):
+    """
+    Stream frames from an opened cv2.VideoCapture through the colorizer into a cv2.VideoWriter.
+    Decoding, colorization and encoding run concurrently with bounded queues between them, so memory
+    does not grow with the length of the video. reuse, e.g. a StaticFrameCache, lets frames skip the model.
+    Yields the number of frames written so far.
+    """
+    frames = prefetch(read_frames(video), queue_size, name="decoded")
+    colorized = prefetch(colorize_frames(frames, colorizer, batch_size, reuse), queue_size, name="colorized")
+    for frames_completed, frame in enumerate(colorized, start=1):
+        with metrics.stage("encode"):
+            writer.write(cv2.cvtColor((frame * 255).astype(np.uint8), cv2.COLOR_RGB2BGR))
+        metrics.count_frames()
+        yield frames_completed
+
+
+def _init_worker(model: str, threads: int, precision: str = PRECISION):
+    """
+    Limits the torch threads of a worker process and loads its colorizer once
+    """
+    global _worker_colorizer  # pylint: disable=global-statement
+    torch.set_num_threads(threads)
+    _worker_colorizer = build_model(model, precision)
+
+
+def _colorize_chunk(frames, batch_size: int, reuse=None):
+    """
+    Colorizes a chunk of frames in a worker process, returns them as uint8 RGB with the (hits, misses) of reuse,
+    a fresh StaticFrameCache or KeyframePropagator for this chunk
+    """
+    colorized = colorize_frames(frames, _worker_colorizer, batch_size, reuse)
+    colorized = np.stack([(frame * 255).astype(np.uint8) for frame in colorized])
+    return colorized, (reuse.hits, reuse.misses) if reuse is not None else (0, 0)
+
+
+def colorize_video_parallel(
+    video,
+    writer,
+    model: str,
+    workers: int = WORKERS,
+    threads_per_worker: int = None,
+    batch_size: int = BATCH_SIZE,
+    chunk_frames: int = CHUNK_FRAMES,
+    reuse=None,
+    precision: str = PRECISION,
+):
+    """
+    Same as colorize_video but colorizes chunks of chunk_frames consecutive frames in worker processes which each
+    load the model called model once, at precision. Chunks are written back in order and at most two chunks per
+    worker are in flight, so memory stays bounded. Torch threads are split between workers unless threads_per_worker
+    is given. A StaticFrameCache or KeyframePropagator given as reuse is copied for every chunk and collects the
+    statistics of all of them.
+    Yields the number of frames written so far.
+    """
+    template = copy.deepcopy(reuse)
+    if template is not None:
+        template.hits = template.misses = 0
+    threads = threads_per_worker or max((os.cpu_count() or 1) // workers, 1)
+    frames = prefetch(read_frames(video), chunk_frames, name="decoded")
+    chunks = iter(lambda: list(itertools.islice(frames, chunk_frames)), [])
+    pending = collections.deque()
+    frames_completed = 0
+
+    # spawn rather than fork, forking a process that already ran torch can deadlock its thread pools
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model, threads, precision),
+    ) as executor:
+        try:
+            for chunk in itertools.chain(chunks, [None]):
+                if chunk is not None:
+                    pending.append(executor.submit(_colorize_chunk, chunk, batch_size, template))
+                metrics.queue_depth("chunks", len(pending))
+                while pending and (chunk is None or len(pending) >= 2 * workers):
+                    # time spent waiting on the workers, their own stages are not recorded in this process
+                    with metrics.stage("chunk_wait"):
+                        colorized, (hits, misses) = pending.popleft().result()
+                    if reuse is not None:
+                        reuse.hits += hits
+                        reuse.misses += misses
+                    for frame in colorized:
+                        with metrics.stage("encode"):
+                            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                        metrics.count_frames()
+                        frames_completed += 1
+                        yield frames_completed
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def file_digest(path, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of the content of the file at path
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def try_lock(path):
+    """
+    Opens path and takes an exclusive lock on it without waiting. Returns the open file, whose closing releases the
+    lock, or None when another open file holds it, in this process or another.
+    """
+    file = open(path, "a+b")  # pylint: disable=consider-using-with
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+class JobBusy(RuntimeError):
+    """
+    Raised by SegmentedVideoJob.run when another job is working in the same workdir
+    """
+
+
+class _Segment:
+    """
+    cv2.VideoCapture-like view of the next frames frames of an opened video, the first of which was already grabbed
+    when grabbed is set
+    """
+
+    def __init__(self, video, frames: int, grabbed: bool = False):
+        self.video = video
+        self.remaining = frames
+        self.grabbed = grabbed
+
+    def read(self):
+        if self.remaining <= 0:
+            return False, None
+        self.remaining -= 1
+        if self.grabbed:
+            self.grabbed = False
+            return self.video.retrieve()
+        return self.video.read()
+
+
+class SegmentedVideoJob:
+    """
+    Colorizes the video at source segment_frames frames at a time. Each finished segment is encoded to its own file in
+    workdir and recorded in its manifest.json, so running the job again, after a crash or from a new session, skips
+    the recorded segments and starts from the first missing one. The segments are then concatenated into the output
+    without re-encoding them and the audio of the source is muxed in.
+    The default workdir is named after the content of the video and the settings, under $COLORIZE_JOBS_DIR or the
+    temporary directory, so the same upload with the same settings finds its earlier progress. reuse is a frame reuse
+    strategy class (see REUSE_MODES), a fresh one colorizes each segment.
+    A run holds an exclusive lock on the file next to workdir named after it with a .lock suffix, so that two jobs
+    of the same upload with the same settings never write to the same workdir: the second one raises JobBusy.
+    """
+
+    def __init__(
+        self,
+        source,
+        model: str,
+        precision: str = PRECISION,
+        reuse=None,
+        segment_frames: int = SEGMENT_FRAMES,
+        batch_size: int = BATCH_SIZE,
+        workdir=None,
+    ):
+        self.source = Path(source)
+        self.reuse = reuse
+        self.segment_frames = segment_frames
+        self.batch_size = batch_size
+        self.settings = {
+            "source_sha256": file_digest(self.source),
+            "model": model,
+            "precision": precision,
+            "reuse": reuse.__name__ if reuse is not None else None,
+            "segment_frames": segment_frames,
+        }
+        key = hashlib.sha256(json.dumps(self.settings, sort_keys=True).encode()).hexdigest()[:16]
+        jobs_dir = Path(os.environ.get(JOBS_DIR_ENV) or Path(tempfile.gettempdir()) / "colorize-jobs")
+        self.workdir = Path(workdir) if workdir is not None else jobs_dir / key
+        self.manifest = self._load_manifest()
+
+    @property
+    def lock_path(self) -> Path:
+        # next to workdir and not in it, cleanup() deletes workdir while holding the lock
+        return self.workdir.with_name(f"{self.workdir.name}.lock")
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.workdir / "manifest.json"
+
+    def _load_manifest(self) -> dict:
+        """
+        The manifest of workdir, or a new one when there is none or it was written for other settings
+        """
+        try:
+            manifest = json.loads(self.manifest_path.read_text())
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is None or manifest.get("settings") != self.settings:
+            manifest = {"settings": self.settings, "segments": [], "finished": False}
+        # only segments whose file is still on disk count, and only up to the first missing one
+        on_disk = lambda segment: (self.workdir / segment["file"]).is_file()  # noqa: E731
+        segments = list(itertools.takewhile(on_disk, manifest["segments"]))
+        manifest["finished"] = manifest["finished"] and len(segments) == len(manifest["segments"])
+        manifest["segments"] = segments
+        return manifest
+
+    def _save_manifest(self):
+        """
+        Writes the manifest through a temporary file, so that a crash never leaves half of it
+        """
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(self.manifest, indent=2))
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def frames_done(self) -> int:
+        return sum(segment["frames"] for segment in self.manifest["segments"])
+
+    def run(self, colorizer, output):
+        """
+        Colorizes the missing segments with colorizer and writes the complete video to output.
+        Yields the number of frames done so far, starting with those of the segments already on disk.
+        """
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        lock = try_lock(self.lock_path)
+        if lock is None:
+            raise JobBusy("the same video is already being colorized with the same settings")
+        with lock:
+            # the manifest may have been written by a job that held the lock before this one
+            self.manifest = self._load_manifest()
+            yield from self._run(colorizer, output)
+
+    def _run(self, colorizer, output):
+        """
+        run() once the lock of workdir is held
+        """
+        if self.manifest["finished"]:
+            # every segment is on disk, only the output is missing
+            if self.frames_done:
+                yield self.frames_done
+            self.concatenate(output)
+            return
+        video = cv2.VideoCapture(str(self.source))
+        if not video.isOpened():
+            raise ValueError(f"cannot open {self.source}")
+        try:
+            frames_done = self.frames_done
+            total = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+            # grab() decodes without converting, skipping the finished segments costs a fraction of colorizing them
+            for _ in range(frames_done):
+                video.grab()
+            if frames_done:
+                yield frames_done
+
+            fps = self.manifest["fps"] = video.get(cv2.CAP_PROP_FPS)
+            while not self.manifest["finished"]:
+                # the first frame of a segment is grabbed before its writer is opened, so that a video whose length
+                # is a multiple of segment_frames does not end with an empty segment
+                if not video.grab():
+                    self.manifest["finished"] = True
+                    self._save_manifest()
+                    break
+                index = len(self.manifest["segments"])
+                filename = f"segment_{index:05d}.mp4"
+                tmp_path = self.workdir / f"{filename}.tmp.mp4"
+                reuse = self.reuse() if self.reuse is not None else None
+                frames = 0
+                with FFmpegWriter(tmp_path, fps, frame_size(video)) as writer:
+                    for frames in colorize_video(
+                        _Segment(video, self.segment_frames, grabbed=True),
+                        writer,
+                        colorizer,
+                        self.batch_size,
+                        reuse=reuse,
+                    ):
+                        yield frames_done + frames
+                if frames:
+                    os.replace(tmp_path, self.workdir / filename)
+                    self.manifest["segments"].append({"file": filename, "frames": frames})
+                    frames_done += frames
+                else:
+                    tmp_path.unlink(missing_ok=True)
+                self.manifest["finished"] = frames < self.segment_frames or 0 < total <= frames_done
+                self._save_manifest()
+        finally:
+            video.release()
+        self.concatenate(output)
+
+    def concatenate(self, output):
+        """
+        Joins the segments into output with ffmpeg's concat demuxer, copying their video and muxing the source audio
+        """
+        if not self.manifest["segments"]:
+            raise ValueError(f"no frames could be decoded from {self.source}")
+        playlist = self.workdir / "segments.txt"
+        playlist.write_text("".join(f"file '{segment['file']}'\n" for segment in self.manifest["segments"]))
+        command = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0"]
+        command += ["-i", str(playlist)] + audio_args(self.source, output)
+        # the audio is cut where the colorized frames end
+        duration = self.frames_done / self.manifest["fps"]
+        command += ["-c:v", "copy", "-t", f"{duration:.6f}", "-movflags", "+faststart", str(output)]
+        process = subprocess.run(command, capture_output=True, text=True, errors="replace", check=False)
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {process.stderr.strip()}")
+
+    def cleanup(self):
+        """
+        Deletes workdir and the segments in it, unless another job is working in it
+        """
+        lock = try_lock(self.lock_path)
+        if lock is None:
+            return
+        with lock:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def colorize_video_job(job, source, model: str, colorizer, workers: int = 1, reuse=None, resumable: bool = False):
+    """
+    Work of a background job (see jobs.JobManager) colorizing the video file source into a temporary mp4 owned by
+    the job. reuse is a frame reuse strategy class (see REUSE_MODES) or None, resumable runs a SegmentedVideoJob.
+    Yields the number of frames completed, returns the output path, the reuse hit rate and the metrics summary.
+    """
+    output = os.path.join(tempfile.gettempdir(), f"colorized_{job.id}.mp4")
+    job.files.append(output)
+    video = cv2.VideoCapture(str(source))
+    if not video.isOpened():
+        raise ValueError("cannot open video")
+    job.total = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    strategy = reuse() if reuse is not None and not resumable else None
+    with metrics.Job("video") as run_metrics:
+        if resumable:
+            video.release()
+            segmented = SegmentedVideoJob(source, model, reuse=reuse)
+            yield from segmented.run(colorizer, output)
+            segmented.cleanup()
+        else:
+            try:
+                fps = video.get(cv2.CAP_PROP_FPS)
+                with FFmpegWriter(output, fps, frame_size(video), audio_source=source) as writer:
+                    if workers > 1:
+                        yield from colorize_video_parallel(video, writer, model, workers=workers, reuse=strategy)
+                    else:
+                        yield from colorize_video(video, writer, colorizer, reuse=strategy)
+            finally:
+                video.release()
+    return {
+        "output": output,
+        "hit_rate": strategy.hit_rate if strategy is not None else None,
+        "metrics": run_metrics.summary(),
+    }